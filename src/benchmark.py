@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+#-------------------------------------------------------------------------
+#
+#
+#    Benchmarks for the rendering, packing and img2pixels hot paths
+#
+#
+#-------------------------------------------------------------------------
+#
+#    This software is part of the TTF2BMH software package to generate bitmap
+#    header files for usage of simple OLED or LCD displays with microprocessors
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#-------------------------------------------------------------------------
+
+import io
+import os
+import sys
+import json
+import time
+import tracemalloc
+import argparse
+import numpy as np
+from PIL import Image
+
+import ttf2bmh
+import img2pixels
+
+BASE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_FONT = os.path.join(BASE_FOLDER, 'fonts', '8x8.ttf')
+BENCH_IMAGES = [
+    # filename, horizontal grids, vertical grids, pieces per block
+    ('creature.png', 1, 1, 5),
+    ('monochrome_grid_size_25.png', 1, 1, 9),
+    ('multiple_test.png', 3, 3, 9),
+]
+ASCII_LINE = " !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~"
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the TTF2BMH and img2pixels hot paths')
+    parser.add_argument('--glyphs', type=int, default=5000, help='Number of glyphs of the synthetic glyph set (Default: 5000)')
+    parser.add_argument('--glyph_height', type=int, default=64, help='Pixel height of the synthetic glyph set (Default: 64)')
+    parser.add_argument('--sheet_size', default='3840x2160', help='Size of the synthetic sprite sheet (Default: 3840x2160)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing runs per stage, the fastest run is reported (Default: 3)')
+    parser.add_argument('--quick', default=False, action='store_true', help='Use small synthetic inputs (500 glyphs, 960x540 sheet)')
+    parser.add_argument('--save', default=None, help='Write the results as baseline JSON file')
+    parser.add_argument('--baseline', default=None, help='Compare with a baseline JSON file and fail on slowdowns')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Allowed slowdown factor against the baseline (Default: 1.25)')
+    args = parser.parse_args()
+
+    if args.quick:
+        args.glyphs = 500
+        args.sheet_size = '960x540'
+    sheet_width, sheet_height = [int(x) for x in args.sheet_size.split('x')]
+
+    results = run_benchmarks(args.glyphs, args.glyph_height, sheet_width, sheet_height, args.repeat)
+    print_results(results)
+
+    if args.save is not None:
+        with open(args.save, 'w', encoding='utf-8') as baseline_file:
+            json.dump({'version': ttf2bmh.VERSION, 'stages': results}, baseline_file, indent=2)
+        print('Baseline written to ' + args.save)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)['stages']
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            for regression in regressions:
+                print('SLOWDOWN ' + regression)
+            return(1)
+        print('No stage slower than ' + str(args.threshold) + 'x baseline')
+    return(0)
+
+#---------------------------------------------------------------------------------------
+# Time a stage (fastest of repeat runs) and measure its peak memory in a separate traced run
+def measure(name, func, items, nbytes, repeat):
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'stage': name,
+        'seconds': seconds,
+        'items': items,
+        'items_per_sec': items / seconds if seconds > 0 else 0.0,
+        'mb_per_sec': nbytes / seconds / 1e6 if seconds > 0 else 0.0,
+        'peak_mb': peak / 1e6,
+    }
+
+#---------------------------------------------------------------------------------------
+# Synthetic inputs, seeded so that every run measures the same data
+def synthetic_atlas(glyphs, height, width):
+    rng = np.random.default_rng(0)
+    return rng.random((height, glyphs * width)) < 0.3
+
+def synthetic_sheet(sheet_width, sheet_height, pixel_size=8):
+    rng = np.random.default_rng(1)
+    cells = rng.random((sheet_height // pixel_size, sheet_width // pixel_size)) < 0.5
+    pixels = np.kron(cells, np.ones((pixel_size, pixel_size), dtype=bool))
+    return Image.fromarray(np.where(pixels, 0, 255).astype(np.uint8)).convert('RGB')
+
+#---------------------------------------------------------------------------------------
+def run_benchmarks(glyphs, glyph_height, sheet_width, sheet_height, repeat):
+    results = []
+
+    # Rendering of the bundled font, ASCII set in all sizes
+    def render_bundled():
+        for height in ttf2bmh.FONT_HEIGHTS:
+            ttf2bmh.render_font(BENCH_FONT, height, ASCII_LINE, variable_width=True)
+    bundled_pixels = sum(len(ASCII_LINE) * height * int(height * 0.75) for height in ttf2bmh.FONT_HEIGHTS)
+    results.append(measure('render_font 8x8.ttf', render_bundled,
+                           len(ASCII_LINE) * len(ttf2bmh.FONT_HEIGHTS), bundled_pixels / 8, repeat))
+
+    # Synthetic large glyph set
+    width = int(glyph_height * 0.75)
+    atlas = synthetic_atlas(glyphs, glyph_height, width)
+    glyph_views = [atlas[:, idx * width:(idx + 1) * width] for idx in range(glyphs)]
+    glyph_bytes = glyphs * width * glyph_height / 8
+
+    results.append(measure('get_pixel_byte', lambda: [ttf2bmh.get_pixel_byte(glyph, glyph_height, width, 0) for glyph in glyph_views],
+                           glyphs, glyph_bytes, repeat))
+    # Same glyphs as 4 bpp gray levels in the SSD1322 row order
+    gray_views = [(glyph * 15).astype(np.uint8) for glyph in glyph_views]
+    gray_bytes = glyphs * ttf2bmh.bitlayout.get_packed_size(glyph_height, width, 'horizontal-msb', 4)
+    results.append(measure('get_pixel_byte 4bpp', lambda: [ttf2bmh.get_pixel_byte(glyph, glyph_height, width, 0, 'horizontal-msb', 4) for glyph in gray_views],
+                           glyphs, gray_bytes, repeat))
+    results.append(measure('calculate_char_width', lambda: [ttf2bmh.calculate_char_width(glyph, width, glyph_height) for glyph in glyph_views],
+                           glyphs, glyph_bytes, repeat))
+
+    dot_arrays = [ttf2bmh.get_pixel_byte(glyph, glyph_height, width, 0) for glyph in glyph_views]
+    def write_chars():
+        outfile = io.StringIO()
+        for idx, dot_array in enumerate(dot_arrays):
+            ttf2bmh.write_bmh_char(outfile, chr(0x4E00 + idx), dot_array, False)
+    results.append(measure('write_bmh_char', write_chars, glyphs, glyph_bytes, repeat))
+
+    # Contact sheet preview decoded from the packed glyphs and streamed one row of glyphs
+    # at a time, like the converter writes it
+    columns = min(ttf2bmh.PREVIEW_COLUMNS, glyphs)
+    rows = (glyphs + columns - 1) // columns
+    def preview_sheet():
+        png_stream = ttf2bmh.open_png_stream(os.devnull, columns * (width + 1) + 1, rows * (glyph_height + 1) + 1)
+        for idx in range(0, glyphs, columns):
+            glyph_dots = [ttf2bmh.decode_glyph(dot_array, glyph_height, width) for dot_array in dot_arrays[idx:idx + columns]]
+            ttf2bmh.write_png_rows(png_stream, ttf2bmh.make_contact_sheet_band(glyph_dots, glyph_height, width, columns))
+        ttf2bmh.write_png_rows(png_stream, ttf2bmh.make_contact_sheet_band([], 0, width, columns))
+        ttf2bmh.close_png_stream(png_stream)
+    results.append(measure('preview png stream', preview_sheet, glyphs, glyph_bytes, repeat))
+
+    # img2pixels on the bundled test images
+    images = []
+    for filename, num_hor, num_vec, num_columns in BENCH_IMAGES:
+        img = Image.open(os.path.join(BASE_FOLDER, 'test_images', filename))
+        img.load()
+        images.append((img, num_hor, num_vec, num_columns))
+    image_bytes = sum(img.width * img.height * 3 for img, _, _, _ in images)
+    image_grids = sum(num_hor * num_vec for _, num_hor, num_vec, _ in images)
+    def parse_test_images():
+        for img, num_hor, num_vec, num_columns in images:
+            for line in img2pixels.get_grids(img, num_hor, num_vec):
+                for grid in line:
+                    img2pixels.parse_single_grid2array(grid, num_columns)
+    results.append(measure('parse_single_grid2array test_images', parse_test_images, image_grids, image_bytes, repeat))
+
+    # img2pixels on the synthetic sprite sheet, 8x8 pixel cells in 96x96 pixel sprites
+    sheet = synthetic_sheet(sheet_width, sheet_height)
+    num_hor = sheet_width // 96
+    num_vec = sheet_height // 96
+    sheet_grids = img2pixels.get_grids(sheet, num_hor, num_vec)
+    sheet_bytes = sheet_width * sheet_height * 3
+    results.append(measure('format_output sprite sheet', lambda: img2pixels.format_output(sheet_grids, 12, 180, False, 'bench'),
+                           num_hor * num_vec, sheet_bytes, repeat))
+
+    return results
+
+#---------------------------------------------------------------------------------------
+def print_results(results):
+    print('{:<40} {:>10} {:>14} {:>10} {:>10}'.format('Stage', 'Seconds', 'Items/s', 'MB/s', 'Peak MB'))
+    for result in results:
+        print('{:<40} {:>10.4f} {:>14.1f} {:>10.2f} {:>10.2f}'.format(
+            result['stage'], result['seconds'], result['items_per_sec'], result['mb_per_sec'], result['peak_mb']))
+
+# Stages slower than threshold times the baseline
+def compare_results(results, baseline, threshold):
+    baseline_seconds = {stage['stage']: stage['seconds'] for stage in baseline}
+    regressions = []
+    for result in results:
+        reference = baseline_seconds.get(result['stage'])
+        if reference is None or reference <= 0:
+            continue
+        if result['seconds'] > reference * threshold:
+            regressions.append(result['stage'] + ': ' + '{:.4f}s vs {:.4f}s baseline ({:.2f}x)'.format(
+                result['seconds'], reference, result['seconds'] / reference))
+    return regressions
+
+
+if (__name__ == '__main__'):
+    sys.exit(main())
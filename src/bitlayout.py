@@ -0,0 +1,157 @@
+#-------------------------------------------------------------------------
+#
+#
+#    Bit layouts of display controllers, shared by ttf2bmh and img2pixels
+#
+#
+#-------------------------------------------------------------------------
+#
+#    This software is part of the TTF2BMH software package to generate bitmap
+#    header files for usage of simple OLED or LCD displays with microprocessors
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#-------------------------------------------------------------------------
+#
+# A layout is given as ORDER[-BITORDER][-ROTATION], e.g. vertical-lsb or horizontal-msb-90
+#   vertical      pages of 8 pixel rows, one byte per column (SSD1306, SH1106)
+#   horizontal    rows of pixels, 8 pixels per byte, rows padded to full bytes (ST7920, LED matrices)
+#   lsb / msb     first pixel of a byte (top resp. left) in the least / most significant bit,
+#                 defaults to lsb for vertical and msb for horizontal
+#   rotation      0, 90, 180 or 270 degrees clockwise, applied to the bitmap before packing
+#
+# Grayscale bitmaps with 2 or 4 bits per pixel hold 8 / bpp pixels per byte in the same
+# order, e.g. horizontal-msb puts the left pixel into the high nibble (SSD1322)
+
+import numpy as np
+
+LAYOUT_DEFAULT = 'vertical-lsb'
+LAYOUT_ORDERS = ['vertical', 'horizontal']
+LAYOUT_ROTATIONS = [0, 90, 180, 270]
+BPP_VALUES = [1, 2, 4]
+
+def parse_layout(spec):
+    if isinstance(spec, dict):
+        return spec
+    if spec is None:
+        spec = LAYOUT_DEFAULT
+    parts = spec.lower().split('-')
+    order = parts.pop(0)
+    if order not in LAYOUT_ORDERS:
+        raise ValueError("Invalid layout '" + spec + "'. Order should be vertical or horizontal.")
+    bit_order = 'lsb' if order == 'vertical' else 'msb'
+    if parts and parts[0] in ('lsb', 'msb'):
+        bit_order = parts.pop(0)
+    rotation = 0
+    if parts and parts[0].isdigit():
+        rotation = int(parts.pop(0))
+    if parts or rotation not in LAYOUT_ROTATIONS:
+        raise ValueError("Invalid layout '" + spec + "'. Expected ORDER[-lsb|-msb][-0|-90|-180|-270].")
+    return {'order': order, 'bit_order': bit_order, 'rotation': rotation}
+
+def format_layout(layout):
+    layout = parse_layout(layout)
+    return layout['order'] + '-' + layout['bit_order'] + '-' + str(layout['rotation'])
+
+def is_default_layout(layout):
+    return parse_layout(layout) == parse_layout(LAYOUT_DEFAULT)
+
+def describe_layout(layout):
+    layout = parse_layout(layout)
+    if layout['order'] == 'vertical':
+        description = 'vertical pages, ' + ('top' if layout['bit_order'] == 'lsb' else 'bottom') + ' pixel in LSB'
+    else:
+        description = 'horizontal rows, ' + ('left' if layout['bit_order'] == 'lsb' else 'right') + ' pixel in LSB'
+    if layout['rotation']:
+        description += ', rotated ' + str(layout['rotation']) + ' degrees'
+    return description
+
+#---------------------------------------------------------------------------------------
+# Rotate a 2d array of dots clockwise
+def rotate_dots(dots, degrees):
+    if degrees == 0:
+        return dots
+    elif degrees == 90:
+        return np.rot90(dots, -1)
+    elif degrees == 180:
+        return dots[::-1, ::-1]
+    elif degrees == 270:
+        return np.rot90(dots, 1)
+    raise ValueError("Invalid degrees. Degrees should be 90, 180, or 270.")
+
+# Rows and bytes per row of a packed height x width bitmap
+def get_packed_shape(height, width, layout=None, bpp=1):
+    layout = parse_layout(layout)
+    pixels_per_byte = 8 // bpp
+    if layout['rotation'] in (90, 270):
+        height, width = width, height
+    if height <= 0 or width <= 0:
+        return 0, 0
+    if layout['order'] == 'vertical':
+        return (height + pixels_per_byte - 1) // pixels_per_byte, width
+    return height, (width + pixels_per_byte - 1) // pixels_per_byte
+
+def get_packed_size(height, width, layout=None, bpp=1):
+    rows, row_bytes = get_packed_shape(height, width, layout, bpp)
+    return rows * row_bytes
+
+# Bit shift of each pixel within a byte, first pixel first
+def get_pixel_shifts(layout, bpp):
+    shifts = np.arange(0, 8, bpp, dtype=np.uint8)
+    if layout['bit_order'] == 'msb':
+        shifts = shifts[::-1]
+    return shifts
+
+#---------------------------------------------------------------------------------------
+# Pack a bool array [row][column] (or pixel levels 0 .. 2**bpp - 1 for grayscale) to bytes
+# in one bulk operation, missing rows of the last page resp. columns of the last byte are
+# filled with zero bits
+def pack_dots(dots, layout=None, bpp=1):
+    layout = parse_layout(layout)
+    dots = rotate_dots(np.asarray(dots, dtype=bool if bpp == 1 else np.uint8), layout['rotation'])
+    height, width = dots.shape
+    rows, row_bytes = get_packed_shape(height, width, layout['order'] + '-' + layout['bit_order'], bpp)
+    if rows == 0:
+        return bytes()
+    pixels_per_byte = 8 // bpp
+    if layout['order'] == 'vertical':
+        dots = np.pad(dots, ((0, rows * pixels_per_byte - height), (0, 0)))
+        dots = dots.reshape(rows, pixels_per_byte, width)
+        axis = 1
+    else:
+        dots = np.pad(dots, ((0, 0), (0, row_bytes * pixels_per_byte - width)))
+        dots = dots.reshape(rows, row_bytes, pixels_per_byte)
+        axis = 2
+    if bpp == 1:
+        bitorder = 'little' if layout['bit_order'] == 'lsb' else 'big'
+        return np.packbits(dots, axis=axis, bitorder=bitorder).tobytes()
+    shifts = get_pixel_shifts(layout, bpp)
+    shifts = shifts.reshape((1, -1, 1) if axis == 1 else (1, 1, -1))
+    return np.bitwise_or.reduce(dots << shifts, axis=axis).astype(np.uint8).tobytes()
+
+# Inverse of pack_dots, returns the bool array (pixel levels for grayscale) [row][column]
+# in the original orientation
+def unpack_dots(data, height, width, layout=None, bpp=1):
+    layout = parse_layout(layout)
+    rows, row_bytes = get_packed_shape(height, width, layout, bpp)
+    if rows == 0:
+        return np.zeros((max(height, 0), max(width, 0)), dtype=bool if bpp == 1 else np.uint8)
+    packed = np.frombuffer(bytes(data), dtype=np.uint8, count=rows * row_bytes)
+    pixels_per_byte = 8 // bpp
+    shifts = get_pixel_shifts(layout, bpp)
+    mask = (1 << bpp) - 1
+    if layout['order'] == 'vertical':
+        dots = (packed.reshape(rows, 1, row_bytes) >> shifts.reshape(1, -1, 1)) & mask
+        dots = dots.reshape(rows * pixels_per_byte, row_bytes)
+    else:
+        dots = (packed.reshape(rows, row_bytes, 1) >> shifts.reshape(1, 1, -1)) & mask
+        dots = dots.reshape(rows, row_bytes * pixels_per_byte)
+    if layout['rotation'] in (90, 270):
+        dots = dots[:width, :height]
+    else:
+        dots = dots[:height, :width]
+    dots = dots.astype(bool) if bpp == 1 else dots.astype(np.uint8)
+    return rotate_dots(dots, (360 - layout['rotation']) % 360)
@@ -1,63 +1,74 @@
+import io
+import sys
+import json
 import time
-from PIL import Image, ImageStat
+import hashlib
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from PIL import Image, ImageSequence
 import click
 
+from bitlayout import parse_layout, pack_dots, rotate_dots
+
 
 def rotate_2d_array(arr, degrees):
     if degrees == 0:
-        new_array = arr
-    elif degrees == 90:
-        new_array = list(zip(*arr[::-1]))
-    elif degrees == 180:
-        new_array = [row[::-1] for row in arr[::-1]]
-    elif degrees == 270:
-        new_array = list(zip(*arr))[::-1]
-    else:
-        raise ValueError("Invalid degrees. Degrees should be 90, 180, or 270.")
-    return new_array
+        return arr
+    return rotate_dots(np.asarray(arr), degrees).tolist()
 
 
-def parse_single_grid2array(img: Image.Image, num_columns, rotation=180):
+# Sample the cells of one grid in bulk, a cell is set if the sum of its per band medians
+# divided by 3 is below 125 (same as ImageStat.Stat(cell).median). Returns [column][line]
+def sample_grid_cells(img: Image.Image, num_columns):
     pixel_size = img.width // num_columns
     num_lines = img.height // pixel_size
-    blocks = [[] for _ in range(num_columns)]
-    for x in range(num_columns):
-        for y in range(num_lines):
-            target = img.crop((x * pixel_size, y * pixel_size, (x + 1) * pixel_size, (y + 1) * pixel_size))
-            stat = ImageStat.Stat(target)
-            grayscale = sum(stat.median) / 3
-            if grayscale < 125:
-                blocks[x].append(1)
-                continue
-            if grayscale >= 125:
-                blocks[x].append(0)
-                continue
-    rotated_blocks = rotate_2d_array(blocks, degrees=rotation)
-    rotated_str_array = [
-        "".join([str(char) for char in line])
-        for line in rotated_blocks
-    ]
-    rotated_verbose_str = ""
-
-    for line in rotated_str_array:
-        line = line.replace("0", "░░")
-        line = line.replace("1", "██")
-        rotated_verbose_str += "%s\n" % line
-
-    output_c_array = []
-    for line in rotated_str_array:
-        output_c_array.append(
-            int(line, base=2),
-        )
+    if img.mode == "1":
+        img = img.convert("L")
+    pixels = np.asarray(img)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, np.newaxis]
+    num_bands = pixels.shape[2]
+    cells = pixels[:num_lines * pixel_size, :num_columns * pixel_size]
+    cells = cells.reshape(num_lines, pixel_size, num_columns, pixel_size, num_bands)
+    cells = cells.transpose(2, 0, 4, 1, 3).reshape(num_columns, num_lines, num_bands, pixel_size * pixel_size)
+    # ImageStat median is the element at index n // 2 of the sorted cell
+    median_index = cells.shape[-1] // 2
+    medians = np.partition(cells, median_index, axis=-1)[..., median_index]
+    grayscale = medians.sum(axis=-1, dtype=np.int64) / 3
+    return grayscale < 125
+
+
+def pack_dot_lines(lines):
+    # Every line of dots becomes one integer, first dot is the most significant bit
+    num_pad = -lines.shape[1] % 8
+    padded = np.pad(lines, ((0, 0), (num_pad, 0)))
+    return [int.from_bytes(line.tobytes(), "big") for line in np.packbits(padded, axis=1)]
+
+
+# Without layout every line becomes one integer, with a bit layout (see bitlayout.py)
+# the bitmap is packed in the native byte order of the display controller
+def parse_single_grid2array(img: Image.Image, num_columns, rotation=180, layout=None):
+    blocks = sample_grid_cells(img, num_columns)
+    rotated_blocks = rotate_dots(blocks, rotation)
+
+    ascii_art = np.where(rotated_blocks, "██", "░░")
+    rotated_verbose_str = "".join("%s\n" % "".join(line) for line in ascii_art)
+
+    if layout is None:
+        output_c_array = pack_dot_lines(rotated_blocks)
+    else:
+        output_c_array = list(pack_dots(rotated_blocks, layout))
     return output_c_array, rotated_verbose_str
 
 
-def get_grids(img: Image.Image, num_horizontal_grids, num_vertical_grids):
+# Grids row by row as (vertical index, horizontal index, image), cropped when consumed
+def iter_grids(img: Image.Image, num_horizontal_grids, num_vertical_grids):
     grid_width = img.width // num_horizontal_grids
     grid_height = img.height // num_vertical_grids
-    grids = []
     for num_vertical_grid_index in range(num_vertical_grids):
-        grids.append([])
         for num_horizontal_grid_index in range(num_horizontal_grids):
             crop_rectangle = (
                     num_horizontal_grid_index * grid_width,
@@ -65,8 +76,13 @@ def get_grids(img: Image.Image, num_horizontal_grids, num_vertical_grids):
                     (num_horizontal_grid_index + 1) * grid_width,
                     (num_vertical_grid_index + 1) * grid_height,
             )
-            new_img = img.crop(crop_rectangle)
-            grids[num_vertical_grid_index].append(new_img)
+            yield num_vertical_grid_index, num_horizontal_grid_index, img.crop(crop_rectangle)
+
+
+def get_grids(img: Image.Image, num_horizontal_grids, num_vertical_grids):
+    grids = [[] for _ in range(num_vertical_grids)]
+    for num_vertical_grid_index, _, new_img in iter_grids(img, num_horizontal_grids, num_vertical_grids):
+        grids[num_vertical_grid_index].append(new_img)
     return grids
 
 
@@ -87,33 +103,42 @@ def format_single_art_output(bitmap_hor_index, bitmap_vec_index, output_array, v
     return final_var_name, content
 
 
-def format_output(grids, num_hor_pieces_per_block, rotation, verbose, variable_name):
-    output = """// Header file generated by img2pixels for LED display\n"""
-    num_total_grids = 0
+# Header file piece by piece, only the variable names are kept until the address table
+def iter_format_output(grid_iter, num_hor_pieces_per_block, rotation, verbose, variable_name, layout=None):
+    yield """// Header file generated by img2pixels for LED display\n"""
     final_var_names = []
-    for vec_index, line_array in enumerate(grids):
-        for hor_index, grid in enumerate(line_array):
-            out_pixels = parse_single_grid2array(
-                grid,
-                num_hor_pieces_per_block,
-                rotation=rotation,
-            )
-            final_var_name, content = format_single_art_output(vec_index, hor_index, out_pixels, verbose, variable_name)
-            output += content
-            num_total_grids += 1
-            final_var_names.append(final_var_name)
-    output += """\n
+    for vec_index, hor_index, grid in grid_iter:
+        out_pixels = parse_single_grid2array(
+            grid,
+            num_hor_pieces_per_block,
+            rotation=rotation,
+            layout=layout,
+        )
+        final_var_name, content = format_single_art_output(vec_index, hor_index, out_pixels, verbose, variable_name)
+        final_var_names.append(final_var_name)
+        yield content
+    yield """\n
 const char %s_width[] = {%s};
 const char* %s_addr[] = {%s};
     """ % (
         variable_name,
-        ", ".join([str(num_hor_pieces_per_block)] * num_total_grids),
+        ", ".join([str(num_hor_pieces_per_block)] * len(final_var_names)),
         variable_name,
         ", ".join(["&%s" % name for name in final_var_names])
     )
-    return output
 
 
+def format_output(grids, num_hor_pieces_per_block, rotation, verbose, variable_name, layout=None):
+    grid_iter = (
+        (vec_index, hor_index, grid)
+        for vec_index, line_array in enumerate(grids)
+        for hor_index, grid in enumerate(line_array)
+    )
+    return "".join(iter_format_output(grid_iter, num_hor_pieces_per_block, rotation, verbose, variable_name, layout))
+
+
+# With stream=True every bitmap is written as soon as it is converted and nothing is
+# returned, so memory use does not grow with the number of grids
 def parse_image2array(
         input_file,
         out_file,
@@ -122,21 +147,169 @@ def parse_image2array(
         rotation=180,
         verbose=True,
         variable_name="custom_bitmap",
+        stream=False,
+        echo_file=None,
+        layout=None,
 ):
     img = Image.open(input_file)
+    if stream:
+        grid_iter = iter_grids(img, num_horizontal_grids, num_vertical_grids)
+        for content in iter_format_output(grid_iter, num_hor_pieces_per_block, rotation, verbose, variable_name, layout):
+            out_file.write(content)
+            if echo_file is not None:
+                echo_file.write(content)
+        return None
     grids = get_grids(img, num_horizontal_grids, num_vertical_grids)
-    output = format_output(grids, num_hor_pieces_per_block, rotation, verbose, variable_name)
+    output = format_output(grids, num_hor_pieces_per_block, rotation, verbose, variable_name, layout)
     out_file.write(
         output
     )
+    if echo_file is not None:
+        echo_file.write(output)
     return output
 
 
+# Bitmap of parse_single_grid2array as bytes, lines big endian and rounded up to full
+# bytes, or packed in the given bit layout
+def grid_to_bytes(grid: Image.Image, num_columns, rotation=180, layout=None):
+    lines = rotate_dots(sample_grid_cells(grid, num_columns), rotation)
+    if layout is not None:
+        return pack_dots(lines, layout)
+    num_pad = -lines.shape[1] % 8
+    return np.packbits(np.pad(lines, ((0, 0), (num_pad, 0))), axis=1).tobytes()
+
+
+# Packed bytes of all grids of each frame, frames are decoded one at a time
+def iter_animation_frames(img: Image.Image, num_horizontal_grids, num_vertical_grids, num_hor_pieces_per_block, rotation, layout=None):
+    for frame in ImageSequence.Iterator(img):
+        frame = frame.convert("RGB")
+        grid_iter = iter_grids(frame, num_horizontal_grids, num_vertical_grids)
+        yield b"".join(grid_to_bytes(grid, num_hor_pieces_per_block, rotation, layout) for _, _, grid in grid_iter)
+
+
+ANIMATION_KEYFRAME = 1
+ANIMATION_DELTA = 0
+DELTA_MAX_SPAN = 255
+# Unchanged bytes between two changes up to this gap are sent instead of a new record
+DELTA_MERGE_GAP = 3
+
+
+# Delta records of the bytes changed from previous to current frame:
+# uint16 offset (little endian), uint8 length, followed by length bytes
+def encode_delta(previous, current):
+    changed = np.flatnonzero(np.frombuffer(previous, np.uint8) != np.frombuffer(current, np.uint8))
+    records = bytearray()
+    if changed.size == 0:
+        return bytes(records)
+    # Split into spans at gaps larger than DELTA_MERGE_GAP
+    breaks = np.flatnonzero(np.diff(changed) > DELTA_MERGE_GAP + 1)
+    starts = np.concatenate(([changed[0]], changed[breaks + 1]))
+    ends = np.concatenate((changed[breaks], [changed[-1]])) + 1
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        for span_start in range(start, end, DELTA_MAX_SPAN):
+            span_end = min(span_start + DELTA_MAX_SPAN, end)
+            records += (span_start).to_bytes(2, "little")
+            records.append(span_end - span_start)
+            records += current[span_start:span_end]
+    return bytes(records)
+
+
+def apply_delta(frame, records):
+    frame = bytearray(frame)
+    i = 0
+    while i < len(records):
+        offset = int.from_bytes(records[i:i + 2], "little")
+        length = records[i + 2]
+        frame[offset:offset + length] = records[i + 3:i + 3 + length]
+        i += 3 + length
+    return bytes(frame)
+
+
+# (frame type, data) per frame. The first (and every keyframe_interval-th) frame is a
+# keyframe, as is every frame whose delta records would not be smaller
+def encode_animation(frames, keyframe_interval=0):
+    previous = None
+    for frame_index, frame in enumerate(frames):
+        if len(frame) > 0xFFFF:
+            raise ValueError("Frame of %d bytes too large for 16 bit delta offsets" % len(frame))
+        is_keyframe = previous is None or (keyframe_interval > 0 and frame_index % keyframe_interval == 0)
+        if not is_keyframe:
+            records = encode_delta(previous, frame)
+            if len(records) >= len(frame):
+                is_keyframe = True
+        if is_keyframe:
+            yield ANIMATION_KEYFRAME, frame
+        else:
+            yield ANIMATION_DELTA, records
+        previous = frame
+
+
+# Reference player, reconstructs the packed frames from (frame type, data)
+def play_animation(encoded_frames):
+    frame = None
+    for frame_type, data in encoded_frames:
+        if frame_type == ANIMATION_KEYFRAME:
+            frame = bytes(data)
+        else:
+            frame = apply_delta(frame, data)
+        yield frame
+
+
+# Multi frame GIF/APNG to a header with one array per frame, written frame by frame.
+# Returns statistics: frames, keyframes, raw and encoded bytes
+def convert_animation(
+        input_file,
+        out_file,
+        num_horizontal_grids=1, num_vertical_grids=1,
+        num_hor_pieces_per_block=1,
+        rotation=180,
+        variable_name="custom_animation",
+        keyframe_interval=0,
+        layout=None,
+):
+    img = Image.open(input_file)
+    frames = iter_animation_frames(img, num_horizontal_grids, num_vertical_grids, num_hor_pieces_per_block, rotation, layout)
+    out_file.write("// Animation generated by img2pixels for LED display\n")
+    out_file.write("// Keyframes hold %d grids of packed lines, delta frames hold records of\n" % (num_horizontal_grids * num_vertical_grids))
+    out_file.write("// uint16 offset (little endian), uint8 length and length bytes\n")
+    stats = {"frames": 0, "keyframes": 0, "frame_size": 0, "raw_bytes": 0, "encoded_bytes": 0}
+    frame_types = []
+    frame_lengths = []
+    for frame_index, (frame_type, data) in enumerate(encode_animation(frames, keyframe_interval)):
+        if frame_type == ANIMATION_KEYFRAME:
+            stats["frame_size"] = len(data)
+            stats["keyframes"] += 1
+        stats["frames"] += 1
+        stats["raw_bytes"] += stats["frame_size"]
+        stats["encoded_bytes"] += len(data)
+        frame_types.append(str(frame_type))
+        frame_lengths.append(str(len(data)))
+        out_file.write("const unsigned char %s_%04d[] = {%s};\n" % (
+            variable_name, frame_index, ",".join(str(the_byte) for the_byte in data) or "0"))
+    out_file.write("const unsigned int %s_frame_size = %d;\n" % (variable_name, stats["frame_size"]))
+    out_file.write("const unsigned int %s_frame_count = %d;\n" % (variable_name, stats["frames"]))
+    out_file.write("const unsigned char %s_keyframe[] = {%s};\n" % (variable_name, ",".join(frame_types)))
+    out_file.write("const unsigned int %s_length[] = {%s};\n" % (variable_name, ",".join(frame_lengths)))
+    out_file.write("const unsigned char* %s_addr[] = {%s};\n" % (
+        variable_name, ",".join("%s_%04d" % (variable_name, idx) for idx in range(stats["frames"]))))
+    return stats
+
+
 @click.group("defaults")
 def entry():
     pass
 
 
+def validate_layout(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        parse_layout(value)
+    except ValueError as error:
+        raise click.BadParameter(str(error))
+    return value
+
+
 @click.argument("input_file")
 @click.option("-o", "--out-file", default=None, type=click.File(mode="w", encoding="utf-8"))
 @click.option("-nhg", "--num_horizontal_grids", default=1, type=click.INT)
@@ -145,6 +318,12 @@ def entry():
 @click.option("-r", "--rotation", default="180", type=click.Choice(("0", "90", "180", "270")))
 @click.option("-name", "--variable_name", default="custom_bitmap", type=click.STRING)
 @click.option("-v", "--verbose", default=False, type=click.BOOL, is_flag=True, show_default=True)
+@click.option("-s", "--stream", default=False, type=click.BOOL, is_flag=True, show_default=True,
+              help="Write each bitmap to the output file as soon as it is converted, output is not printed unless --echo is given")
+@click.option("-e", "--echo", default=False, type=click.BOOL, is_flag=True, show_default=True,
+              help="Also print the output in --stream mode")
+@click.option("-l", "--layout", default=None, type=click.STRING, callback=validate_layout,
+              help="Pack bytes in a display bit layout, e.g. vertical-lsb or horizontal-msb-90, instead of one integer per line")
 @entry.command("cli")
 def cli(input_file,
         out_file,
@@ -154,6 +333,9 @@ def cli(input_file,
         rotation,
         verbose,
         variable_name,
+        stream,
+        echo,
+        layout,
         ):
     if out_file is None:
         out_file = open("custom_bitmap.h", "w", encoding="utf-8")
@@ -165,13 +347,223 @@ def cli(input_file,
         int(rotation),
         verbose,
         variable_name,
+        stream=stream,
+        echo_file=sys.stdout if (stream and echo) else None,
+        layout=layout,
     )
     out_file.close()
-    print(output)
+    if not stream:
+        print(output)
 
 
-def http_server():
-    pass
+SERVER_PARAMETERS = {
+    # name: (type, default)
+    "num_horizontal_grids": (int, 1),
+    "num_vertical_grids": (int, 1),
+    "num_hor_pieces_per_block": (int, 1),
+    "rotation": (int, 180),
+    "variable_name": (str, "custom_bitmap"),
+    "verbose": (int, 0),
+    "format": (str, "header"),
+    "layout": (str, ""),
+}
+
+
+def parse_server_parameters(query):
+    values = parse_qs(query)
+    params = {}
+    for name, (value_type, default) in SERVER_PARAMETERS.items():
+        params[name] = value_type(values[name][-1]) if name in values else default
+    if params["rotation"] not in (0, 90, 180, 270):
+        raise ValueError("Invalid degrees. Degrees should be 90, 180, or 270.")
+    if params["format"] not in ("header", "json"):
+        raise ValueError("format must be header or json")
+    if params["layout"]:
+        parse_layout(params["layout"])
+    return params
+
+
+# Header file (format=header) or dict with the bitmap arrays (format=json)
+def convert_image_bytes(image_bytes, params):
+    img = Image.open(io.BytesIO(image_bytes))
+    grid_iter = iter_grids(img, params["num_horizontal_grids"], params["num_vertical_grids"])
+    if params["format"] == "header":
+        return "".join(iter_format_output(
+            grid_iter,
+            params["num_hor_pieces_per_block"],
+            params["rotation"],
+            bool(params["verbose"]),
+            params["variable_name"],
+            params["layout"] or None,
+        ))
+    bitmaps = []
+    for vec_index, hor_index, grid in grid_iter:
+        c_array, _ = parse_single_grid2array(grid, params["num_hor_pieces_per_block"], rotation=params["rotation"],
+                                             layout=params["layout"] or None)
+        final_var_name = f"{params['variable_name']}_{vec_index:0<4}_{hor_index:0<4}"
+        bitmaps.append({"name": final_var_name, "vec_index": vec_index, "hor_index": hor_index, "data": c_array})
+    return {"width": params["num_hor_pieces_per_block"], "bitmaps": bitmaps}
+
+
+# LRU cache of conversion results keyed by image hash and parameters, plus request
+# metrics, shared by all handler threads
+class ConversionService:
+    def __init__(self, cache_size=128):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.metrics = {
+            "requests": 0,
+            "errors": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "latency_total_ms": 0.0,
+            "latency_max_ms": 0.0,
+        }
+
+    def convert(self, image_bytes, params):
+        key = (hashlib.sha256(image_bytes).hexdigest(), tuple(sorted(params.items())))
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.metrics["cache_hits"] += 1
+                return self.cache[key]
+            self.metrics["cache_misses"] += 1
+        # Conversion runs outside the lock, concurrent requests are converted in parallel
+        result = convert_image_bytes(image_bytes, params)
+        with self.lock:
+            self.cache[key] = result
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+    def record_request(self, latency_ms, error=False):
+        with self.lock:
+            self.metrics["requests"] += 1
+            self.metrics["errors"] += int(error)
+            self.metrics["latency_total_ms"] += latency_ms
+            self.metrics["latency_max_ms"] = max(self.metrics["latency_max_ms"], latency_ms)
+
+    def get_metrics(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+            metrics["cache_size"] = len(self.cache)
+        requests = metrics["requests"]
+        metrics["latency_mean_ms"] = metrics["latency_total_ms"] / requests if requests else 0.0
+        lookups = metrics["cache_hits"] + metrics["cache_misses"]
+        metrics["cache_hit_ratio"] = metrics["cache_hits"] / lookups if lookups else 0.0
+        return metrics
+
+
+# POST /convert?<parameters> with the image file as body, GET /metrics
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if urlparse(self.path).path != "/metrics":
+            self.send_error(404)
+            return
+        self.send_body(200, "application/json", json.dumps(self.server.service.get_metrics()))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/convert":
+            self.send_error(404)
+            return
+        start = time.perf_counter()
+        error = False
+        try:
+            params = parse_server_parameters(url.query)
+            image_bytes = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            result = self.server.service.convert(image_bytes, params)
+            if params["format"] == "json":
+                self.send_body(200, "application/json", json.dumps(result))
+            else:
+                self.send_body(200, "text/plain; charset=utf-8", result)
+        except Exception as e:
+            error = True
+            self.send_body(400, "application/json", json.dumps({"error": f"{type(e).__name__}: {e}"}))
+        finally:
+            self.server.service.record_request((time.perf_counter() - start) * 1000, error)
+
+    def send_body(self, status, content_type, body):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+# Server without starting it, port 0 binds a free port (see server.server_address)
+def make_http_server(host="127.0.0.1", port=8020, cache_size=128, verbose=False):
+    server = ThreadingHTTPServer((host, port), ConversionRequestHandler)
+    server.daemon_threads = True
+    server.service = ConversionService(cache_size)
+    server.verbose = verbose
+    return server
+
+
+@click.argument("input_file")
+@click.option("-o", "--out-file", default=None, type=click.File(mode="w", encoding="utf-8"))
+@click.option("-nhg", "--num_horizontal_grids", default=1, type=click.INT)
+@click.option("-nvg", "--num_vertical_grids", default=1, type=click.INT)
+@click.option("-nhppb", "--num_hor_pieces_per_block", default=1, type=click.INT)
+@click.option("-r", "--rotation", default="180", type=click.Choice(("0", "90", "180", "270")))
+@click.option("-name", "--variable_name", default="custom_animation", type=click.STRING)
+@click.option("-k", "--keyframe_interval", default=0, type=click.INT, show_default=True,
+              help="Emit a keyframe every N frames, 0 only for the first frame")
+@click.option("-l", "--layout", default=None, type=click.STRING, callback=validate_layout,
+              help="Pack frames in a display bit layout, e.g. vertical-lsb or horizontal-msb-90, instead of big endian lines")
+@entry.command("animation")
+def animation(input_file,
+              out_file,
+              num_horizontal_grids,
+              num_vertical_grids,
+              num_hor_pieces_per_block,
+              rotation,
+              variable_name,
+              keyframe_interval,
+              layout,
+              ):
+    if out_file is None:
+        out_file = open("custom_animation.h", "w", encoding="utf-8")
+    stats = convert_animation(
+        input_file,
+        out_file,
+        num_horizontal_grids, num_vertical_grids,
+        num_hor_pieces_per_block,
+        int(rotation),
+        variable_name,
+        keyframe_interval,
+        layout,
+    )
+    out_file.close()
+    print("%d frames (%d keyframes), %d bytes raw, %d bytes encoded" % (
+        stats["frames"], stats["keyframes"], stats["raw_bytes"], stats["encoded_bytes"]))
+
+
+def http_server(host="127.0.0.1", port=8020, cache_size=128, verbose=False):
+    server = make_http_server(host, port, cache_size, verbose)
+    print("img2pixels server listening on http://%s:%d" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@click.option("-h", "--host", default="127.0.0.1", type=click.STRING, show_default=True)
+@click.option("-p", "--port", default=8020, type=click.INT, show_default=True)
+@click.option("-c", "--cache-size", default=128, type=click.INT, show_default=True)
+@click.option("-v", "--verbose", default=False, type=click.BOOL, is_flag=True, show_default=True)
+@entry.command("server")
+def server(host, port, cache_size, verbose):
+    http_server(host, port, cache_size, verbose)
 
 
 if __name__ == '__main__':
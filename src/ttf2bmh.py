@@ -33,27 +33,98 @@
 import re
 import os
 import sys
+import io
+import json
+import filecmp
+import functools
+import hashlib
+import mmap
+import struct
+import time
+import tracemalloc
+import csv
+import bisect
+from array import array
+import multiprocessing
+from collections import Counter
+from contextlib import redirect_stdout
 import subprocess
-from shutil import copyfile
+import tempfile
+import zlib
+from shutil import copyfile, copyfileobj
 from fontTools import ttLib
+from fontTools.pens.boundsPen import BoundsPen
 from PIL import Image, ImageFont, ImageDraw
+import numpy as np
 import argparse
 
+import bitlayout
+
 VERSION = '2.1'
+FONT_INDEX_VERSION = 1
+FONT_INDEX_FILENAME = 'ttf2bmh_fontindex.json'
+# Bump whenever the bytes of a generated header, pack or preview change
+BUILD_CACHE_VERSION = 4
+BUILD_CACHE_FILENAME = 'ttf2bmh_buildcache.json'
+SOURCE_EXTENSIONS = ['.c', '.h', '.cc', '.cpp', '.cxx', '.hh', '.hpp', '.hxx', '.ino', '.json', '.po', '.pot']
+METRICS_CACHE_VERSION = 1
+METRICS_CACHE_FILENAME = 'ttf2bmh_metrics.json'
+FACE_CACHE_SIZE = 64
+
+# Definition of Font Heights and offsets
+FONT_HEIGHTS = [8, 24, 32, 40, 48, 56, 64]
+FONT_YOFFSETS = [0, 6, 5, 7, 8, 9, 10]
+
+# ASCII art characters of the gray levels for --print_ascii
+GRAY_SHADES = {2: '.:+#', 4: '.,:;-=+*oO0%&$@#'}
+
+PROFILE_STAGES = ['font_parse', 'font_load', 'rasterize', 'trim', 'pack', 'write', 'png']
+
+# Stage profile of the current process, None unless --profile is given
+_profile = None
+_profile_unit = ('', '')
+
+PACK_MAGIC = b'BMHP'
+PACK_VERSION = 1
+PACK_HEADER_FORMAT = '<4s6H6I'
+PACK_C_HEADER_FILENAME = 'ttf2bmh_pack.h'
+
+# Streaming conversion: characters rendered per atlas and write buffer of the output files
+RENDER_CHUNK_SIZE = 256
+WRITE_BUFFER_SIZE = 1 << 16
 
 # Tab to iterate over Font Files in specific directory
 def main():
-    TTF_FILES = []
+    parser = get_argument_parser()
+    args = parser.parse_args()
+    set_default_ttf_folder(args)
 
+    if len(sys.argv) == 1:
+        parser.print_help()
+        return(1)
+    elif (args.license):
+        print_license()
+        return(0)
+    elif args.manifest is not None:
+        return run_manifest(parser, args)
+    else :
+        check_option_combinations(parser, args)
+        return convert_job(args)
+
+def get_argument_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('-l','--license',help='show license terms', action='store_true')
     parser.add_argument('-f','--ttf_folder', default = 'C:\\Windows\\Fonts\\', help='Folder where ttf files are stored (Defaults to C:\\Windows\\Fonts\\ on Windows, /usr/share/fonts on Linux)')
     parser.add_argument('-o','--output_folder', default = 'bmh_fonts', help='Folder where bitmapheader output files will be stored. A subfolder for each Font will be created under the directory (Defaults to ./bmhfonts)')
     parser.add_argument('-c','--character_filename', help='filename for characters to be processed')
     parser.add_argument('-C','--characters', type=str, help='String of characters to be processed (if no character_filename passed in)')
+    parser.add_argument('--chars_from_source', default=None, help='Use the characters of all string literals in the C/C++, JSON and PO files of this folder, most frequent first (if no character_filename or characters passed in)')
+    parser.add_argument('--char_frequencies', default=None, help='Write the character counts of --chars_from_source to a .csv or .json file')
+    parser.add_argument('--rare_threshold', type=int, default=0, help='With --chars_from_source, characters used less often are split off into the --rare_characters file (Default: 0)')
+    parser.add_argument('--rare_characters', default=None, help='Character file for the characters below --rare_threshold, e.g. for a secondary font')
     parser.add_argument('--ascii', action='store_true', help='Convert for all ascii characters (overrides -c and -C)')
     parser.add_argument('--font', default = '', help='Define Font Name to be processed. Name should include modifier like Bold or Italic. If none is given, all fonts in folder will be processed.')
-    parser.add_argument('-s','--fontsize', default='32', choices=['8','24', '32', '40', '48', '56', '64', 'all'], help='Fontsize (Fontheight) in pixels. Default: 32')
+    parser.add_argument('-s','--fontsize', default='32', type=fontsize_type, help='Fontsize (Fontheight) in pixels or all. Heights other than 8, 24, 32, 40, 48, 56 and 64 are sized from the font metrics. Default: 32')
     parser.add_argument('-O','--offset', type=int, help='Y Offset for characters (Default is based off font size)')
     parser.add_argument('--variable_width', default=False, action='store_true', help='Variable width of characters.')
     parser.add_argument('-fh','--font_height', help='Define fontsize of rendered font within the defined pixel image boundary')
@@ -63,167 +134,885 @@ def main():
     parser.add_argument('--print_binary',dest='print_binary', default=False, action='store_true',help='Print each character as binary array on commandline, for debugging')
     parser.add_argument('--square', default=False, action='store_true',help='Make the font square instead of height by (height * 0.75)')
     parser.add_argument('-fw','--font_width', default=None, help='Force set font-width of rendered font for specified font')
-    args = parser.parse_args()
-
+    parser.add_argument('--output_format', default='header', choices=['header', 'pack'], help='Write C header files or one binary font pack (.bin) per font and size (Default: header)')
+    parser.add_argument('--lookup', default='none', choices=['none', 'sorted', 'segments'], help='Add a codepoint lookup table with a char_lookup() function: sorted codepoint array (binary search) or range segments (Default: none)')
+    parser.add_argument('--dedup', default=False, action='store_true', help='Emit identical character bitmaps only once, char_addr points to the shared array')
+    parser.add_argument('--layout', default=None, type=layout_type, help='Bit layout of the character bitmaps: vertical pages or horizontal rows, lsb or msb first, rotation 0, 90, 180 or 270, e.g. horizontal-msb-90 (Default: vertical-lsb, SSD1306, and horizontal-msb for --bpp 2 and 4)')
+    parser.add_argument('--bpp', type=int, default=1, choices=bitlayout.BPP_VALUES, help='Bits per pixel, 2 and 4 keep the anti-aliasing as gray levels for grayscale displays like SSD1322 or SSD1327 (Default: 1)')
+    parser.add_argument('--compress', default='none', choices=['none', 'rle'], help='Store the character bitmaps compressed in one array with an offset table and a C decoder (Default: none)')
+    parser.add_argument('--preview', default='png', choices=list(PREVIEW_EXTENSIONS), help='Preview files decoded from the generated bitmaps: png contact sheet, txt ASCII dump, both or none (Default: png)')
+    parser.add_argument('--no_preview', dest='preview', action='store_const', const='none', help='Do not write previews, same as --preview none')
+    parser.add_argument('-j','--jobs', type=int, default=1, help='Number of parallel conversion processes, 0 uses all CPU cores (Default: 1)')
+    parser.add_argument('--rebuild', default=False, action='store_true', help='Ignore the build cache and convert all fonts and sizes again')
+    parser.add_argument('--profile', default=False, action='store_true', help='Time and count each conversion stage and trace the peak memory per font and size, print a summary')
+    parser.add_argument('--profile_output', default=None, help='Write the --profile trace per font, size and stage to a .json or .csv file')
+    parser.add_argument('--skip_missing', default=False, action='store_true', help='Do not convert characters the font has no glyph for (checked in the font cmap before rendering)')
+    parser.add_argument('--min_coverage', default=0.0, type=coverage_type, help='Skip fonts which contain less than this percentage of the characters, e.g. 100%% (Default: 0)')
+    parser.add_argument('--coverage_report', default=None, help='Write coverage and missing characters per font to a JSON file')
+    parser.add_argument('--font_index', default=None, help='File of the persistent font name index used for --font lookup and folder scans (Defaults to ' + FONT_INDEX_FILENAME + ' in the output folder)')
+    parser.add_argument('--manifest', default=None, help='Run all conversion jobs of a JSON or TOML manifest in one process with one consolidated log')
+    return parser
+
+def fontsize_type(value):
+    if value != 'all' and not (value.isdigit() and int(value) > 0):
+        raise argparse.ArgumentTypeError("invalid fontsize: '" + value + "' (pixel height or all)")
+    return value
+
+# Percentage 0 .. 100, with or without % sign
+def coverage_type(value):
+    try:
+        coverage = float(value.rstrip('%'))
+    except ValueError:
+        coverage = -1.0
+    if not 0 <= coverage <= 100:
+        raise argparse.ArgumentTypeError("invalid coverage: '" + value + "' (percentage 0 .. 100)")
+    return coverage
+
+def layout_type(value):
+    try:
+        return bitlayout.format_layout(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+# Options that only apply to header files are rejected for font packs
+def check_option_combinations(parser, args):
+    if args.output_format == 'pack':
+        if args.compress != 'none':
+            parser.error('argument --compress: not supported with --output_format pack')
+        if args.lookup != 'none':
+            parser.error('argument --lookup: not supported with --output_format pack, packs are sorted by codepoint')
+
+# Monochrome displays use pages, grayscale controllers rows with the left pixel in the high bits
+def get_default_layout(layout, bpp):
+    if layout is not None:
+        return layout
+    if bpp == 1:
+        return bitlayout.format_layout(bitlayout.LAYOUT_DEFAULT)
+    return bitlayout.format_layout('horizontal-msb')
+
+def set_default_ttf_folder(args):
     if sys.platform == 'linux' and args.ttf_folder == "C:\\Windows\\Fonts\\":
         args.ttf_folder = "/usr/share/fonts"
 
-    if len(sys.argv) == 1:
-        parser.print_help()
-        return(1)
-    elif (args.license):
-        print_license()
-        return(0)
-    else :
-        progmem = args.progmem
-        print_ascii = args.print_ascii
-        # Folder to iterate on
-        ttf_searchfolder = args.ttf_folder
-        output_folder = args.output_folder
+#---------------------------------------------------------------------------------------
+# Convert all fonts and sizes of one set of arguments, session is shared between the jobs of a manifest
+def convert_job(args, session=None):
+    TTF_FILES = []
+    if session is None:
+        session = new_session()
+
+    progmem = args.progmem
+    print_ascii = args.print_ascii
+    # Folder to iterate on
+    ttf_searchfolder = args.ttf_folder
+    output_folder = args.output_folder
+
+    if not (os.path.exists(output_folder)):
+        os.mkdir(output_folder)
 
-        if not (os.path.exists(output_folder)):
-            os.mkdir(output_folder)
+    if not (os.path.exists(ttf_searchfolder)):
+        print('TTF Folder does not exist')
+        return(-1)
 
-        if not (os.path.exists(ttf_searchfolder)):
-            print('TTF Folder does not exist')
+    variable_width = args.variable_width
+
+    if args.profile or args.profile_output is not None:
+        profile_enable()
+
+    # Font name index, only fonts added or changed since the last run are parsed
+    if args.font_index is not None:
+        font_index_filename = args.font_index
+    else:
+        font_index_filename = os.path.join(output_folder, FONT_INDEX_FILENAME)
+    font_index = session_font_index(session, font_index_filename)
+
+    Target_Font = args.font
+    if not (Target_Font == ''):
+        ttf_filename, ttf_abs_dir = get_ttf_filename (Target_Font, ttf_searchfolder, font_index, session_ttf_folder(session, ttf_searchfolder))
+        if(ttf_filename == -1):
+            save_font_index(font_index, font_index_filename)
+            print('No font with name: ' + Target_Font +' found' )
             return(-1)
+        else:
+            ttf_file = {'dir': ttf_abs_dir, 'filename': ttf_filename}
+        TTF_FILES.append(ttf_file)
+    else:
+        TTF_FILES = session_ttf_folder(session, ttf_searchfolder)
+        update_font_index(font_index, TTF_FILES)
+    save_font_index(font_index, font_index_filename)
 
-        variable_width = args.variable_width
 
-        Target_Font = args.font
-        if not (Target_Font == ''):
-            ttf_filename, ttf_abs_dir = get_ttf_filename (Target_Font, ttf_searchfolder)
-            if(ttf_filename == -1):
-                print('No font with name: ' + Target_Font +' found' )
-                return(-1)
-            else:
-                ttf_file = {'dir': ttf_abs_dir, 'filename': ttf_filename}
-            TTF_FILES.append(ttf_file)
+    if(args.fontsize == 'all'):
+        heights = FONT_HEIGHTS
+    else:
+        heights = [int(args.fontsize)]
+
+    if args.ascii:
+        [character_line,chars] = dedup_characters(" !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~")
+    elif args.character_filename is not None:
+        # Read characters from file
+        [character_line,chars] = read_character_file(args.character_filename)
+    elif args.characters is not None:
+        # Read characters from command line
+        [character_line,chars] = dedup_characters(args.characters)
+    elif args.chars_from_source is not None:
+        # Characters of the string literals in a source tree
+        if not (os.path.exists(args.chars_from_source)):
+            print('Source Folder does not exist')
+            return(-1)
+        [character_line,chars] = read_source_characters(args.chars_from_source, args.jobs, args.char_frequencies,
+                                                        args.rare_threshold, args.rare_characters)
+    else:
+        # Defaults to all numbers + colon if no chars given
+        character_line = "0123456789:"
+        chars = ['0','1','2','3','4','5','6','7','8','9',':']
+
+    print("Converting characters: \"" + character_line + "\"")
+
+    # Coverage preflight from the cmap of each font, before anything is rendered
+    coverage_report = check_font_coverage(font_index, TTF_FILES, chars, args.min_coverage)
+    for ttf_absolute_filename, coverage in coverage_report.items():
+        if coverage['skipped']:
+            print(coverage['name'] + ' skipped, coverage ' + '{:.1f}'.format(coverage['coverage']) + '%')
+        elif coverage['missing'] and len(TTF_FILES) < 20:
+            print(coverage['name'] + ': no glyph for \"' + coverage['missing'] + '\"')
+    if args.coverage_report is not None:
+        write_json_atomic(coverage_report, args.coverage_report)
+
+    # Build cache, units whose inputs did not change since the last run are skipped
+    build_cache_filename = os.path.join(output_folder, BUILD_CACHE_FILENAME)
+    build_cache = load_build_cache(build_cache_filename)
+    use_build_cache = not (args.rebuild or print_ascii or args.print_binary)
+
+    # Collect conversion units, one per font and size
+    units = []
+    for ttf_file in TTF_FILES:
+        # Generate and check file paths and
+        ttf_filename = ttf_file['filename']
+        ttf_filepath = os.path.abspath(ttf_file['dir'])
+        ttf_absolute_filename = os.path.join(ttf_filepath, ttf_filename)
+        Font = font_index['fonts'][ttf_absolute_filename]['name']
+        coverage = coverage_report[ttf_absolute_filename]
+        if coverage['skipped']:
+            continue
+        if args.skip_missing and coverage['missing']:
+            missing_chars = set(coverage['missing'])
+            font_chars = [x for x in chars if x not in missing_chars]
+        else:
+            font_chars = chars
+        if not font_chars:
+            # Empty arrays are no valid C, a font without any of the characters is not converted
+            print(Font + ' skipped, no glyph for any of the characters')
+            continue
+        font_character_line = "".join(font_chars)
+
+        output_bmh_folder = os.path.join(output_folder, Font)
+        if not (os.path.exists(output_bmh_folder)):
+            os.mkdir(output_bmh_folder)
+        ttf_hash = file_sha256(ttf_absolute_filename)
+        metrics_cache_filename = os.path.join(output_bmh_folder, METRICS_CACHE_FILENAME)
+        metrics_cache = load_metrics_cache(metrics_cache_filename, ttf_hash)
+
+        for height in heights:
+            [width, yoffset, font_height] = get_size_parameters(height, args.font_width, args.square, args.offset, args.font_height)
+            if uses_metric_size(height, args.offset, args.font_height):
+                [yoffset, font_height] = get_cached_metric_size(metrics_cache, ttf_absolute_filename, height, font_character_line, args.offset, args.font_height)
+
+            units.append({
+                'ttf_absolute_filename': ttf_absolute_filename,
+                'Font': Font,
+                'output_bmh_folder': output_bmh_folder,
+                'filename': Font + '_' + str(height),
+                'height': height,
+                'width': width,
+                'yoffset': yoffset,
+                'font_height': font_height,
+                'chars': font_chars,
+                'character_line': font_character_line,
+                'variable_width': variable_width,
+                'progmem': progmem,
+                'print_ascii': print_ascii,
+                'print_binary': args.print_binary,
+                'dedup': args.dedup,
+                'compress': args.compress,
+                'lookup': args.lookup,
+                'output_format': args.output_format,
+                'layout': get_default_layout(args.layout, args.bpp),
+                'bpp': args.bpp,
+                'preview': args.preview,
+                'output_ext': '.bin' if args.output_format == 'pack' else '.h',
+                'profile': _profile is not None,
+                'cache_name': os.path.join(Font, Font + '_' + str(height)),
+            })
+            units[-1]['cache_key'] = get_unit_cache_key(units[-1], ttf_hash)
+        save_metrics_cache(metrics_cache, metrics_cache_filename)
+
+    if args.output_format == 'pack':
+        write_pack_C_header(os.path.join(output_folder, PACK_C_HEADER_FILENAME))
+
+    # Start logging, jobs of a manifest append to the log of the session
+    if session['logfile'] is None:
+        logfile = logfile_open(output_folder)
+    else:
+        logfile = session['logfile']
+    profile_records = profile_collect()
+
+    # Main Loop, results arrive in the order of the units
+    failed = 0
+    for result in run_conversion_units(units, args.jobs, build_cache if use_build_cache else None):
+        sys.stdout.write(result['output'])
+        profile_records += result['profile']
+        filename = result['filename']
+        if result['error'] is None:
+            if(len(TTF_FILES)<20):
+                if result['status'] == 'written':
+                    print(filename + result['output_ext'] + ' written')
+                else:
+                    print(filename + result['output_ext'] + ' up to date')
+            build_cache['units'][result['cache_name']] = result['cache_key']
+            logfile_append(logfile, filename, result['output_ext'])
         else:
-            TTF_FILES = search_ttf_folder(ttf_searchfolder)
+            build_cache['units'].pop(result['cache_name'], None)
+            failed += 1
+            print('Error converting ' + filename + ': ' + result['error'])
+            logfile_append_error(logfile, filename, result['error'], result['output_ext'])
+    save_build_cache(build_cache, build_cache_filename)
+
+    #print('-------------------------------------------------------------------------')
+    print("TTF2BMH Finished")
+    if session['logfile'] is None:
+        logfile_close(logfile)
 
+    if _profile is not None:
+        print_profile_summary(profile_records)
+        if args.profile_output is not None:
+            write_profile_trace(profile_records, args.profile_output)
+    # Non-zero exit code if any unit failed, so that build scripts notice
+    return(1 if failed else 0)
 
-        # Definition of Font Heights and offsets
-        font_heights = [8, 24, 32, 40, 48, 56, 64]
-        font_yoffsets = [0, 6, 5, 7, 8, 9, 10]
+#---------------------------------------------------------------------------------------
+# Session shared by all jobs of one process
+# Font indexes and folder scans are kept per file and folder, PIL and fontTools faces
+# are shared through the lru caches of load_pil_font and load_tt_font
+def new_session(logfile=None):
+    return {'font_indexes': {}, 'ttf_folders': {}, 'logfile': logfile}
+
+def session_font_index(session, index_filename):
+    index_filename = os.path.abspath(index_filename)
+    if index_filename not in session['font_indexes']:
+        session['font_indexes'][index_filename] = load_font_index(index_filename)
+    return session['font_indexes'][index_filename]
+
+def session_ttf_folder(session, ttf_searchfolder):
+    ttf_searchfolder = os.path.abspath(ttf_searchfolder)
+    if ttf_searchfolder not in session['ttf_folders']:
+        session['ttf_folders'][ttf_searchfolder] = search_ttf_folder(ttf_searchfolder)
+    return session['ttf_folders'][ttf_searchfolder]
 
-        if(args.fontsize == 'all'):
-            height_indices = range(len(font_heights))
+#---------------------------------------------------------------------------------------
+# Batch manifest, a list of jobs with the long option names of the command line as keys
+#   {"defaults": {"ttf_folder": "fonts"}, "jobs": [{"font": "GuanZhi bitmap", "fontsize": "8"}]}
+# Options of the command line apply to every job, defaults and job entries override them
+def load_manifest(manifest_filename):
+    if manifest_filename.endswith('.toml'):
+        import tomllib
+        with open(manifest_filename, 'rb') as manifest_file:
+            manifest = tomllib.load(manifest_file)
+    else:
+        with open(manifest_filename, 'r', encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    return manifest
+
+# Command line arguments of one manifest entry, flags are given as true or false
+def get_manifest_argv(options):
+    argv = []
+    for key, value in options.items():
+        if key == 'name' or value is None or value is False:
+            continue
+        if value is True:
+            argv.append('--' + key)
         else:
-            height_indices = [font_heights.index(int(args.fontsize))]
-
-        if args.ascii:
-            chars = []
-            character_line = " !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~"
-            [chars.append(x) for x in character_line if x not in chars]
-            character_line = "".join(chars)
-        elif args.character_filename is not None:
-            # Read characters from file
-            [character_line,chars] = read_character_file(args.character_filename)
-        elif args.characters is not None:
-            # Read characters from command line
-            chars = []
-            character_line = args.characters
-            [chars.append(x) for x in character_line if x not in chars]
-            character_line = "".join(chars)
+            # One argument, so that values starting with - are not read as options
+            argv.append('--' + key + '=' + str(value))
+    return argv
+
+# false leaves a flag at its default, it cannot switch off a flag that is set by the
+# defaults or the command line
+def check_manifest_flags(parser, options, job_args):
+    for key, value in options.items():
+        if value is not False:
+            continue
+        action = parser._option_string_actions.get('--' + key)
+        if action is not None and getattr(job_args, action.dest) != parser.get_default(action.dest):
+            parser.error('manifest option ' + key + ': false cannot switch off a flag set by the defaults or the command line')
+
+def run_manifest(parser, args):
+    manifest = load_manifest(args.manifest)
+    args.manifest = None
+    defaults_argv = get_manifest_argv(manifest.get('defaults', {}))
+    defaults_args = parser.parse_args(defaults_argv, namespace=argparse.Namespace(**vars(args)))
+    check_manifest_flags(parser, manifest.get('defaults', {}), defaults_args)
+
+    # All jobs are parsed before the first one runs, so an invalid entry stops nothing halfway
+    jobs = []
+    for idx, options in enumerate(manifest.get('jobs', [])):
+        job_args = parser.parse_args(defaults_argv + get_manifest_argv(options), namespace=argparse.Namespace(**vars(args)))
+        check_manifest_flags(parser, options, job_args)
+        set_default_ttf_folder(job_args)
+        check_option_combinations(parser, job_args)
+        jobs.append((options.get('name', 'job ' + str(idx + 1)), job_args))
+
+    # One log for all jobs in the output folder of the manifest defaults
+    output_folder = defaults_args.output_folder
+    if not (os.path.exists(output_folder)):
+        os.mkdir(output_folder)
+    session = new_session(logfile_open(output_folder))
+    failed = 0
+    for idx, (name, job_args) in enumerate(jobs):
+        print('=========================================================================')
+        print('Job ' + str(idx + 1) + '/' + str(len(jobs)) + ': ' + name)
+        logfile_append_job(session['logfile'], name)
+        if convert_job(job_args, session) != 0:
+            logfile_append_error(session['logfile'], name, 'job failed', '')
+            failed += 1
+    logfile_close(session['logfile'])
+
+    print(str(len(jobs) - failed) + ' of ' + str(len(jobs)) + ' jobs finished')
+    return(1 if failed else 0)
+
+#---------------------------------------------------------------------------------------
+# Convert one font in one size to a header and picture file
+# Glyphs are rendered in chunks and written as they come, only the width and bitmap tables
+# (and the digests of unique bitmaps when deduplicating) are kept until the end
+def convert_font_size(unit):
+    height = unit['height']
+    width = unit['width']
+    width_array = array('h')
+    # Bitmap used by each character, identical bitmaps share one array when deduplicating
+    bitmap_ids = array('L')
+    unique_bitmaps = {}
+    saved_bytes = 0
+    # Compressed glyph streams or binary pack data
+    compress = unit['compress']
+    pack_mode = unit['output_format'] == 'pack'
+    raw_size = 0
+
+    # Filename Definitions
+    filename = unit['filename'] # General Filename
+    out_filename = os.path.join(unit['output_bmh_folder'], filename + unit['output_ext']) # Outputfile for font
+
+    glyphs = iter_render_font(unit['ttf_absolute_filename'], height, unit['chars'],
+                              width=width, yoffset=unit['yoffset'], font_height=unit['font_height'],
+                              variable_width=unit['variable_width'], layout=unit['layout'], bpp=unit['bpp'])
+
+    # Open BMH file and start writing, files are written to a temporary file first and
+    # only replace the output file if their content differs
+    out_tmp_filename = temp_filename(out_filename)
+    if pack_mode:
+        pack_writer = open_bmh_pack_writer(out_tmp_filename, len(unit['chars']))
+    else:
+        outfile = write_bmh_head(out_tmp_filename, unit['Font'], height, unit['layout'], unit['bpp'])
+        if compress == 'rle':
+            rle_spill = open_rle_spill()
+    previews = open_previews(unit)
+
+    for glyph in glyphs:
+        start = profile_time()
+        char = glyph['char']
+        char_width = glyph['width']
+        dot_array = glyph['bitmap']
+        width_array.append(char_width)
+        bitmap_key = hashlib.blake2b(dot_array, digest_size=16).digest() if unit['dedup'] else None
+
+        if bitmap_key in unique_bitmaps:
+            bitmap_ids.append(unique_bitmaps[bitmap_key])
+            saved_bytes += len(dot_array)
         else:
-            # Defaults to all numbers + colon if no chars given
-            character_line = "0123456789:"
-            chars = ['0','1','2','3','4','5','6','7','8','9',':']
+            if pack_mode:
+                bitmap_id = append_bmh_pack_data(pack_writer, dot_array)
+            elif compress == 'rle':
+                bitmap_id = append_rle_spill(rle_spill, rle_encode(dot_array))
+            else:
+                bitmap_id = ord(char)
+                write_bmh_char(outfile, char, dot_array, unit['progmem'])
+            if bitmap_key is not None:
+                unique_bitmaps[bitmap_key] = bitmap_id
+            bitmap_ids.append(bitmap_id)
+        raw_size += len(dot_array)
+        if(unit['print_ascii']):
+            print(char + ":")
+            print_char(decode_glyph(dot_array, height, char_width, unit['layout'], unit['bpp']), height, char_width, 0, unit['bpp'])
+        if unit['print_binary']:
+            from pprint import pprint
+            pprint(get_binary_str_array(dot_array, height))
+        profile_add('write', start)
+
+        # write previews of all characters
+        start = profile_time()
+        append_preview(previews, glyph)
+        profile_add('png', start, 0)
+
+    start = profile_time()
+    if pack_mode:
+        close_bmh_pack_writer(pack_writer, unit['character_line'], width_array, bitmap_ids, width, height, unit['variable_width'], unit['layout'], unit['bpp'])
+    else:
+        if unit['lookup'] != 'none':
+            write_bmh_lookup(outfile, unit['character_line'], unit['lookup'])
+
+        # write tail and close bmh file
+        if compress == 'rle':
+            rle_size = rle_spill['size']
+            write_bmh_rle_tail(outfile, width_array, rle_spill, bitmap_ids, height, unit['progmem'], unit['layout'], unit['bpp'])
+            print(filename + '.h: RLE ' + str(raw_size) + ' -> ' + str(rle_size) + ' bytes (ratio ' + '{:.2f}'.format(rle_size / max(raw_size, 1)) + ')')
+        else:
+            write_bmh_tail(outfile, width_array, unit['character_line'], bitmap_ids)
+    if unit['dedup']:
+        print(filename + unit['output_ext'] + ': ' + str(len(unit['chars']) - len(unique_bitmaps)) + ' duplicate bitmaps, ' + str(saved_bytes) + ' bytes saved')
+    out_changed = replace_if_changed(out_tmp_filename, out_filename)
+    profile_add('write', start, 0)
 
-        print("Converting characters: \"" + character_line + "\"")
+    start = profile_time()
+    preview_changed = close_previews(previews)
+    profile_add('png', start)
+    return out_changed or preview_changed
 
-        # Start logging
-        logfile = logfile_open(output_folder)
+#---------------------------------------------------------------------------------------
+# Rendering API
+# Renders the characters of a TTF file in one size to page ordered bitmaps in memory.
+# Returns a dict with the cell 'width' and 'height', the glyph 'atlas' and one glyph dict
+# per character: 'char', 'width', 'x_offset', 'bitmap' (page bytes) and 'image' (atlas view).
+# The bitmaps are packed in the given bit layout, see bitlayout.py. With bpp 2 or 4 the
+# atlas holds gray levels 0 .. 2**bpp - 1 instead of dots.
+# Parameters left at None are derived from the height like on the command line.
+def render_font(ttf_filename, height, chars, width=None, yoffset=None, font_height=None,
+                variable_width=False, square=False, layout=None, bpp=1):
+    [width, PILfont, yoffset] = get_render_parameters(ttf_filename, height, chars, width, yoffset, font_height, square)
+    start = profile_time()
+    atlas = render_glyph_atlas(chars, PILfont, width, height, yoffset, bpp)
+    profile_add('rasterize', start, len(chars))
+    glyphs = list(iter_atlas_glyphs(atlas, chars, width, height, variable_width, layout, bpp))
+
+    return {'width': width, 'height': height, 'atlas': atlas, 'glyphs': glyphs}
+
+# Same glyph dicts as render_font, but rendered in atlases of chunk_size characters and
+# yielded one by one. Only the current chunk is held in memory, so large character sets
+# can be written out while they are rendered.
+def iter_render_font(ttf_filename, height, chars, width=None, yoffset=None, font_height=None,
+                     variable_width=False, square=False, layout=None, bpp=1, chunk_size=RENDER_CHUNK_SIZE):
+    [width, PILfont, yoffset] = get_render_parameters(ttf_filename, height, chars, width, yoffset, font_height, square)
+    for chunk_start in range(0, len(chars), chunk_size):
+        chunk = chars[chunk_start:chunk_start + chunk_size]
+        start = profile_time()
+        atlas = render_glyph_atlas(chunk, PILfont, width, height, yoffset, bpp)
+        profile_add('rasterize', start, len(chunk))
+        yield from iter_atlas_glyphs(atlas, chunk, width, height, variable_width, layout, bpp)
+
+# Cell width, loaded face and y offset for rendering
+def get_render_parameters(ttf_filename, height, chars, width=None, yoffset=None, font_height=None, square=False):
+    if uses_metric_size(height, yoffset, font_height):
+        [yoffset, font_height] = get_metric_size_parameters(os.path.abspath(ttf_filename), height, chars, yoffset, font_height)
+    [width, yoffset, font_height] = get_size_parameters(height, width, square, yoffset, font_height)
+    start = profile_time()
+    PILfont = get_pil_font(os.path.abspath(ttf_filename), font_height)
+    profile_add('font_load', start)
+    return [width, PILfont, yoffset]
+
+# Trim and pack the glyphs of an atlas
+def iter_atlas_glyphs(atlas, chars, width, height, variable_width=False, layout=None, bpp=1):
+    for char_idx, char in enumerate(chars):
+        # Glyph is a view into the atlas
+        image = atlas[:, char_idx * width:(char_idx + 1) * width]
+        if(variable_width):
+            start = profile_time()
+            [zero_col_cnt_left, zero_col_cnt_right] = calculate_char_width(image, width, height)
+            profile_add('trim', start)
+            char_width = width - zero_col_cnt_right - zero_col_cnt_left
+            x_offset = zero_col_cnt_left
+        else:
+            char_width = width
+            x_offset = 0
+        start = profile_time()
+        dot_array = get_pixel_byte(image, height, char_width, x_offset, layout, bpp)
+        profile_add('pack', start)
+        yield {
+            'char': char,
+            'width': char_width,
+            'x_offset': x_offset,
+            'bitmap': dot_array,
+            'image': image,
+        }
+
+# Character cell width, y offset and rendered font size for a pixel height
+def get_size_parameters(height, width=None, square=False, yoffset=None, font_height=None):
+    if width is not None:
+        width = int(width)
+    elif square:
+        width = height
+    else:
+        width = int(height * 0.75)
+    if yoffset is None:
+        if height in FONT_HEIGHTS:
+            yoffset = FONT_YOFFSETS[FONT_HEIGHTS.index(height)]
+        else:
+            yoffset = 0
+    if font_height is None:
+        font_height = int(height*1.1)
+    else:
+        font_height = int(font_height)
+    return [width, int(yoffset), font_height]
 
-        # Main Loop
-        for ttf_file in TTF_FILES:
-            # Generate and check file paths and
-            ttf_filename = ttf_file['filename']
-            ttf_filepath = os.path.abspath(ttf_file['dir'])
-            ttf_absolute_filename = os.path.join(ttf_filepath, ttf_filename)
-            tt = ttLib.TTFont(ttf_absolute_filename)
-            fm = tt['name'].names[4].string
-            Font = fm.decode('utf-8')
-            Font = re.sub('\x00','',Font)
-
-            output_bmh_folder = os.path.join(output_folder, Font)
-            if not (os.path.exists(output_bmh_folder)):
-                os.mkdir(output_bmh_folder)
-
-            for height_idx in height_indices:
-                width_array = []
-
-                # initialize PIL Image
-                height = font_heights[height_idx]
-
-                if args.font_width is not None:
-                    width = int(args.font_width)
-                else:
-                    if args.square:
-                        width = height
-                    else:
-                        width = int(height * 0.75)
-                if args.offset is not None:
-                    yoffset = args.offset
-                else:
-                    yoffset = font_yoffsets[height_idx]
-
-                # Filename Definitions
-                filename = Font + '_' + str(height) # General Filename
-                h_filename = os.path.join(output_bmh_folder, filename + '.h') # Outputfile for font
-                png_filename = os.path.join(output_bmh_folder, filename + '.png') # Outputfile for font
-
-                # define PILfont
-                size = [width, height]
-
-                if (args.font_height is None):
-                    font_height = int(font_heights[height_idx]*1.1)
-
-                #font_height = int(height*1.1)
-                PILfont = ImageFont.truetype(ttf_absolute_filename, font_height)
-
-                # Open BMH file and start writing
-                outfile = write_bmh_head(h_filename, Font, height)
-
-                for char in chars:
-                    # Create pixel image with PIL
-                    image =  Image.new('1', size, color=255)
-                    draw = ImageDraw.Draw(image)
-                    draw.text((0, -yoffset), char, font=PILfont)
-
-                    # Calculate byte arrays and write to file
-
-                    if(variable_width):
-                        [zero_col_cnt_left, zero_col_cnt_right] = calculate_char_width(image, width, height)
-                        char_width = width - zero_col_cnt_right - zero_col_cnt_left
-                        x_offset = zero_col_cnt_left
-                    else:
-                        char_width = width
-                        x_offset = 0
-
-                    width_array.append(str(char_width))
-                    dot_array = get_pixel_byte(image, height, char_width, x_offset)
-
-                    write_bmh_char(outfile, char, dot_array, progmem)
-                    if(print_ascii):
-                        print(char + ":")
-                        print_char(image, height, char_width, x_offset)
-                    if args.print_binary:
-                        from pprint import pprint
-                        pprint(get_binary_str_array(dot_array, height))
-
-                # write tail and close bmh file
-                write_bmh_tail(outfile, width_array, character_line)
-                # write Image picture with all characters
-                write_pic_file(character_line, PILfont, width, height, png_filename)
-                if(len(TTF_FILES)<20):
-                    print(filename + '.h written')
-                logfile_append(logfile, filename)
-
-        #print('-------------------------------------------------------------------------')
-        print("TTF2BMH Finished")
-        logfile_close(logfile)
+#---------------------------------------------------------------------------------------
+# Metric based sizing for heights without table entry
+# The em size is chosen so that the ink of the characters (bbox over their outlines, cap
+# height and descender if none of them has an outline) fits the height, the y offset moves
+# the ink top from the ascender line, where PIL draws, into the vertically centered box
+def uses_metric_size(height, yoffset=None, font_height=None):
+    return height not in FONT_HEIGHTS and (yoffset is None or font_height is None)
+
+def get_font_vertical_metrics(ttf_absolute_filename, chars):
+    tt = get_tt_font(ttf_absolute_filename)
+    hhea = tt['hhea']
+    os2 = tt['OS/2'] if 'OS/2' in tt else None
+    # FreeType takes the ascender from hhea, from OS/2 if USE_TYPO_METRICS is set or hhea is empty
+    ascender = hhea.ascent
+    descender = hhea.descent
+    if os2 is not None and os2.fsSelection & (1 << 7):
+        ascender = os2.sTypoAscender
+        descender = os2.sTypoDescender
+    elif ascender == 0 and os2 is not None:
+        ascender = os2.sTypoAscender or os2.usWinAscent
+        descender = os2.sTypoDescender or -os2.usWinDescent
+    cap_height = getattr(os2, 'sCapHeight', 0) or ascender
+
+    cmap = tt.getBestCmap() or {}
+    glyph_set = tt.getGlyphSet()
+    ink_top = None
+    ink_bottom = None
+    for char in set(chars):
+        glyph_name = cmap.get(ord(char))
+        if glyph_name is None:
+            continue
+        pen = BoundsPen(glyph_set)
+        glyph_set[glyph_name].draw(pen)
+        if pen.bounds is None:
+            continue
+        ink_top = pen.bounds[3] if ink_top is None else max(ink_top, pen.bounds[3])
+        ink_bottom = pen.bounds[1] if ink_bottom is None else min(ink_bottom, pen.bounds[1])
+    if ink_top is None:
+        ink_top = cap_height
+        ink_bottom = descender
+
+    return {
+        'units_per_em': tt['head'].unitsPerEm,
+        'ascender': ascender,
+        'descender': descender,
+        'cap_height': cap_height,
+        'ink_top': ink_top,
+        'ink_bottom': min(ink_bottom, 0),
+    }
+
+def get_metric_size_parameters(ttf_absolute_filename, height, chars, yoffset=None, font_height=None):
+    metrics = get_font_vertical_metrics(ttf_absolute_filename, chars)
+    units_per_em = metrics['units_per_em']
+    ink_height = max(metrics['ink_top'] - metrics['ink_bottom'], 1)
+    # Ink rows of an em size, rounded outwards like the rasterizer does, plus one row
+    # above for hinting which may move the top edge up by one pixel
+    ink_rows = lambda size: int(np.ceil(metrics['ink_top'] * size / units_per_em) - np.floor(metrics['ink_bottom'] * size / units_per_em)) + 1
+    if font_height is None:
+        font_height = max(int(height * units_per_em / ink_height), 1)
+        while font_height > 1 and ink_rows(font_height) > height:
+            font_height -= 1
+    else:
+        font_height = int(font_height)
+    if yoffset is None:
+        scale = font_height / units_per_em
+        ink_top_px = np.ceil(metrics['ascender'] * scale) - np.ceil(metrics['ink_top'] * scale)
+        margin = (height - ink_rows(font_height)) // 2 + 1
+        yoffset = int(ink_top_px - margin)
+    return [int(yoffset), font_height]
+
+# Sidecar file per font with the metric sizes of earlier runs, valid for one TTF file content
+def load_metrics_cache(cache_filename, ttf_hash):
+    metrics_cache = {'version': METRICS_CACHE_VERSION, 'ttf_hash': ttf_hash, 'sizes': {}, 'changed': False}
+    if os.path.exists(cache_filename):
+        try:
+            with open(cache_filename, 'r', encoding='utf-8') as cache_file:
+                stored_cache = json.load(cache_file)
+            if stored_cache.get('version') == METRICS_CACHE_VERSION and stored_cache.get('ttf_hash') == ttf_hash:
+                metrics_cache['sizes'] = stored_cache['sizes']
+        except (OSError, ValueError, KeyError):
+            pass
+    return metrics_cache
+
+def save_metrics_cache(metrics_cache, cache_filename):
+    if not metrics_cache['changed']:
+        return 0
+    write_json_atomic({key: value for key, value in metrics_cache.items() if key != 'changed'}, cache_filename)
+    metrics_cache['changed'] = False
+    return 0
+
+def get_cached_metric_size(metrics_cache, ttf_absolute_filename, height, character_line, yoffset=None, font_height=None):
+    key = str(height) + '_' + hashlib.sha256(character_line.encode('utf-8')).hexdigest()[:16]
+    if key not in metrics_cache['sizes']:
+        metrics_cache['sizes'][key] = get_metric_size_parameters(ttf_absolute_filename, height, character_line)
+        metrics_cache['changed'] = True
+    [metric_yoffset, metric_font_height] = metrics_cache['sizes'][key]
+    if font_height is not None:
+        # Offset belongs to the metric em size, recompute it for the given one
+        return get_metric_size_parameters(ttf_absolute_filename, height, character_line, yoffset, font_height)
+    if yoffset is not None:
+        return [int(yoffset), metric_font_height]
+    return [metric_yoffset, metric_font_height]
+
+# Loaded faces are kept per process, keyed by (path, size) resp. path and the mtime and
+# size of the file, so a font file replaced while the process runs is loaded again
+def get_pil_font(ttf_absolute_filename, font_height):
+    return load_pil_font(ttf_absolute_filename, font_height, get_file_stamp(ttf_absolute_filename))
+
+def get_tt_font(ttf_absolute_filename):
+    return load_tt_font(ttf_absolute_filename, get_file_stamp(ttf_absolute_filename))
+
+def get_file_stamp(filename):
+    stat = os.stat(filename)
+    return (stat.st_mtime, stat.st_size)
+
+@functools.lru_cache(maxsize=FACE_CACHE_SIZE)
+def load_pil_font(ttf_absolute_filename, font_height, file_stamp):
+    return ImageFont.truetype(ttf_absolute_filename, font_height)
+
+@functools.lru_cache(maxsize=FACE_CACHE_SIZE)
+def load_tt_font(ttf_absolute_filename, file_stamp):
+    return ttLib.TTFont(ttf_absolute_filename, lazy=True)
+
+#---------------------------------------------------------------------------------------
+# Run one conversion unit, console output is captured and errors are reported
+# instead of raised, so that a failing unit does not stop the batch
+def run_conversion_unit(unit):
+    output = io.StringIO()
+    error = None
+    status = None
+    if unit['profile']:
+        profile_enable()
+        profile_set_unit(unit['Font'], unit['height'])
+        profile_memory_start()
+    try:
+        with redirect_stdout(output):
+            if convert_font_size(unit):
+                status = 'written'
+            else:
+                status = 'unchanged'
+    except Exception as e:
+        error = type(e).__name__ + ': ' + str(e)
+        remove_unit_temp_files(unit)
+    result = get_unit_result(unit, status, output.getvalue(), error)
+    result['profile'] = profile_collect(profile_memory_stop() if unit['profile'] else 0)
+    return result
+
+def remove_unit_temp_files(unit):
+    filename = os.path.join(unit['output_bmh_folder'], unit['filename'])
+    for ext in [unit['output_ext']] + PREVIEW_EXTENSIONS[unit['preview']]:
+        tmp_filename = temp_filename(filename + ext)
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+def get_unit_result(unit, status, output='', error=None):
+    return {
+        'filename': unit['filename'],
+        'output_ext': unit['output_ext'],
+        'cache_name': unit['cache_name'],
+        'cache_key': unit['cache_key'],
+        'status': status,
+        'output': output,
+        'error': error,
+        'profile': [],
+    }
+
+#---------------------------------------------------------------------------------------
+# Run all conversion units, spread over a process pool if more than one job is requested.
+# Units found in the build cache are not converted again.
+def run_conversion_units(units, jobs=1, build_cache=None):
+    cached = [build_cache is not None and is_unit_cached(build_cache, unit) for unit in units]
+    todo_units = [unit for unit, unit_cached in zip(units, cached) if not unit_cached]
+
+    if jobs is None or jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(todo_units))
+    pool = None
+    if jobs <= 1:
+        results = map(run_conversion_unit, todo_units)
+    else:
+        pool = multiprocessing.Pool(jobs)
+        results = pool.imap(run_conversion_unit, todo_units)
+
+    try:
+        for unit, unit_cached in zip(units, cached):
+            if unit_cached:
+                yield get_unit_result(unit, 'cached')
+            else:
+                yield next(results)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+#---------------------------------------------------------------------------------------
+# Stage profiling
+# Stages are timed per font and size. When profiling is off, profile_time() returns
+# None and profile_add() returns immediately, so the hot paths only pay two calls.
+# The peak of the Python and NumPy allocations of each font and size is traced with
+# tracemalloc, only while profiling.
+def profile_enable():
+    global _profile
+    if _profile is None:
+        _profile = {}
+
+def profile_set_unit(Font, height):
+    global _profile_unit
+    _profile_unit = (Font, height)
+
+def profile_time():
+    if _profile is None:
+        return None
+    return time.perf_counter()
+
+def profile_add(stage, start, count=1):
+    if start is None:
+        return
+    key = (_profile_unit[0], _profile_unit[1], stage)
+    entry = _profile.get(key)
+    if entry is None:
+        entry = _profile[key] = [0, 0.0]
+    entry[0] += count
+    entry[1] += time.perf_counter() - start
+
+def profile_memory_start():
+    tracemalloc.start()
+
+# Peak traced memory since profile_memory_start() in bytes
+def profile_memory_stop():
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak_bytes
+
+# Return and clear the records of the current process, peak_bytes is the memory peak of
+# the unit the records belong to (0 if not traced)
+def profile_collect(peak_bytes=0):
+    if _profile is None:
+        return []
+    records = [{'font': key[0], 'size': key[1], 'stage': key[2], 'count': entry[0], 'seconds': entry[1], 'peak_bytes': peak_bytes}
+               for key, entry in _profile.items()]
+    _profile.clear()
+    return records
+
+def print_profile_summary(records):
+    totals = {stage: [0, 0.0] for stage in PROFILE_STAGES}
+    for record in records:
+        totals[record['stage']][0] += record['count']
+        totals[record['stage']][1] += record['seconds']
+    total_seconds = sum(total[1] for total in totals.values())
+
+    print('-------------------------------------------------------------------------')
+    print('{:<12} {:>10} {:>12} {:>14} {:>8}'.format('Stage', 'Count', 'Seconds', 'us/item', 'Share'))
+    for stage in PROFILE_STAGES:
+        count, seconds = totals[stage]
+        if count == 0:
+            continue
+        print('{:<12} {:>10} {:>12.4f} {:>14.1f} {:>7.1f}%'.format(
+            stage, count, seconds, seconds / count * 1e6, 100 * seconds / total_seconds if total_seconds > 0 else 0))
+    print('{:<12} {:>10} {:>12.4f}'.format('total', '', total_seconds))
+    peak = max(records, key=lambda record: record['peak_bytes'], default=None)
+    if peak is not None and peak['peak_bytes'] > 0:
+        print('Peak memory {:.1f} MB ({} {})'.format(peak['peak_bytes'] / 1e6, peak['font'], peak['size']))
+    print('-------------------------------------------------------------------------')
+
+def write_profile_trace(records, trace_filename):
+    if trace_filename.lower().endswith('.csv'):
+        with open(trace_filename, 'w', newline='', encoding='utf-8') as trace_file:
+            writer = csv.DictWriter(trace_file, fieldnames=['font', 'size', 'stage', 'count', 'seconds', 'peak_bytes'])
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(trace_filename, 'w', encoding='utf-8') as trace_file:
+            json.dump(records, trace_file, indent=1)
+
+#---------------------------------------------------------------------------------------
+# Incremental build cache
+# Each unit is identified by a hash over the TTF file content and all parameters that
+# influence the generated header and picture file
+def file_sha256(filename):
+    file_hash = hashlib.sha256()
+    with open(filename, 'rb') as hash_file:
+        for block in iter(lambda: hash_file.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def get_unit_cache_key(unit, ttf_hash):
+    key_fields = [
+        VERSION,
+        ttf_hash,
+        unit['Font'],
+        unit['height'],
+        unit['width'],
+        unit['yoffset'],
+        unit['font_height'],
+        unit['character_line'],
+        unit['progmem'],
+        unit['variable_width'],
+        unit['dedup'],
+        unit['compress'],
+        unit['lookup'],
+        unit['output_format'],
+        bitlayout.format_layout(unit['layout']),
+        unit['bpp'],
+        unit['preview'],
+    ]
+    return hashlib.sha256(json.dumps(key_fields).encode('utf-8')).hexdigest()
+
+def is_unit_cached(build_cache, unit):
+    if build_cache['units'].get(unit['cache_name']) != unit['cache_key']:
+        return False
+    filename = os.path.join(unit['output_bmh_folder'], unit['filename'])
+    return all(os.path.exists(filename + ext) for ext in [unit['output_ext']] + PREVIEW_EXTENSIONS[unit['preview']])
+
+def load_build_cache(cache_filename):
+    build_cache = {'version': BUILD_CACHE_VERSION, 'units': {}}
+    if os.path.exists(cache_filename):
+        try:
+            with open(cache_filename, 'r', encoding='utf-8') as cache_file:
+                stored_cache = json.load(cache_file)
+            if stored_cache.get('version') == BUILD_CACHE_VERSION:
+                build_cache['units'] = stored_cache['units']
+        except (OSError, ValueError, KeyError):
+            # Unreadable cache, everything is converted again
+            pass
+    return build_cache
+
+def save_build_cache(build_cache, cache_filename):
+    write_json_atomic(build_cache, cache_filename)
+    return 0
+
+#---------------------------------------------------------------------------------------
+# Atomic file helpers
+def temp_filename(filename):
+    # Keep the extension, PIL derives the picture format from it
+    base, ext = os.path.splitext(filename)
+    return base + '.tmp' + str(os.getpid()) + ext
+
+def write_json_atomic(data, filename):
+    tmp_filename = temp_filename(filename)
+    with open(tmp_filename, 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file)
+    os.replace(tmp_filename, filename)
+
+# Move temporary file over target if content differs, otherwise drop it
+def replace_if_changed(tmp_filename, filename):
+    if os.path.exists(filename) and filecmp.cmp(tmp_filename, filename, shallow=False):
+        os.remove(tmp_filename)
+        return False
+    os.replace(tmp_filename, filename)
+    return True
 
 #---------------------------------------------------------------------------------------
 def print_program_header():
@@ -260,22 +1049,19 @@ def print_license():
 
 #---------------------------------------------------------------------------------------
 # Search all Folders and check for filenames of Font Names, required by PIL TTF Font handler
-def get_ttf_filename (Target_Font, ttf_searchfolder):
-    TTF_FILES = []
+def get_ttf_filename (Target_Font, ttf_searchfolder, font_index=None, TTF_FILES=None):
     target_ttf_file = -1
     target_ttf_dir = -1
-    for dirpath, dirnames, filenames in os.walk(ttf_searchfolder):
-        for filename in [f for f in filenames if f.endswith(".ttf")]:
-            ttf_file = {'dir': dirpath, 'filename': filename}
-            TTF_FILES.append(ttf_file)
+    if font_index is None:
+        font_index = new_font_index()
 
-    for ttf_file in TTF_FILES:
-        ttf_absolute_filename = os.path.join(ttf_file['dir'], ttf_file['filename'])
-        tt = ttLib.TTFont(ttf_absolute_filename)
-        fm = tt['name'].names[4].string
-        Font = fm.decode('ascii', errors ='replace')
+    if TTF_FILES is None:
+        TTF_FILES = search_ttf_folder(ttf_searchfolder)
+    update_font_index(font_index, TTF_FILES)
 
-        Font = re.sub('\x00','',Font)
+    for ttf_file in TTF_FILES:
+        ttf_absolute_filename = os.path.abspath(os.path.join(ttf_file['dir'], ttf_file['filename']))
+        Font = font_index['fonts'][ttf_absolute_filename]['name']
         if(Target_Font == Font):
             target_ttf_file =  ttf_file['filename']
             target_ttf_dir  =  ttf_file['dir']
@@ -283,113 +1069,453 @@ def get_ttf_filename (Target_Font, ttf_searchfolder):
     return target_ttf_file, target_ttf_dir
 
 #---------------------------------------------------------------------------------------
-# Write picture file
-def write_pic_file(character_line, PILfont, width, height, png_filename):
-
-    mode = '1'
-    pic_size = (len(character_line) * width, height+10)
-    image_pic =  Image.new(mode, pic_size, color=255)
-    draw_pic = ImageDraw.Draw(image_pic)
-    draw_pic.text((0, 0), character_line, font=PILfont)
-    image_pic.save(png_filename)
+# Characters without glyph in the cmap coverage ranges of the font index
+def get_missing_chars(coverage, chars):
+    range_starts = [coverage_range[0] for coverage_range in coverage]
+    missing = []
+    for char in chars:
+        idx = bisect.bisect_right(range_starts, ord(char)) - 1
+        if idx < 0 or coverage[idx][1] < ord(char):
+            missing.append(char)
+    return missing
+
+# Coverage of the characters per font, fonts below min_coverage percent are skipped
+def check_font_coverage(font_index, TTF_FILES, chars, min_coverage=0):
+    coverage_report = {}
+    for ttf_file in TTF_FILES:
+        ttf_absolute_filename = os.path.abspath(os.path.join(ttf_file['dir'], ttf_file['filename']))
+        entry = font_index['fonts'][ttf_absolute_filename]
+        missing = get_missing_chars(entry['coverage'], chars)
+        if len(chars) > 0:
+            coverage = 100.0 * (len(chars) - len(missing)) / len(chars)
+        else:
+            coverage = 100.0
+        coverage_report[ttf_absolute_filename] = {
+            'name': entry['name'],
+            'coverage': coverage,
+            'missing': "".join(missing),
+            'skipped': coverage < min_coverage,
+        }
+    return coverage_report
 
+#---------------------------------------------------------------------------------------
+# Persistent font name index
+# Entries are keyed by the absolute path of the TTF file and are only valid as long as
+# mtime and size of the file match, otherwise the font is parsed again
+def new_font_index():
+    return {'version': FONT_INDEX_VERSION, 'fonts': {}, 'changed': False}
+
+def load_font_index(index_filename):
+    font_index = new_font_index()
+    if os.path.exists(index_filename):
+        try:
+            with open(index_filename, 'r', encoding='utf-8') as index_file:
+                stored_index = json.load(index_file)
+            if stored_index.get('version') == FONT_INDEX_VERSION:
+                font_index['fonts'] = stored_index['fonts']
+        except (OSError, ValueError, KeyError):
+            # Unreadable index is rebuilt from scratch
+            font_index['changed'] = True
+    return font_index
+
+def save_font_index(font_index, index_filename):
+    if not font_index['changed']:
+        return 0
+    write_json_atomic({'version': FONT_INDEX_VERSION, 'fonts': font_index['fonts']}, index_filename)
+    font_index['changed'] = False
     return 0
 
+# Bring index entries of given TTF files up to date
+def update_font_index(font_index, TTF_FILES):
+    fonts = font_index['fonts']
+    for ttf_file in TTF_FILES:
+        ttf_absolute_filename = os.path.abspath(os.path.join(ttf_file['dir'], ttf_file['filename']))
+        stat = os.stat(ttf_absolute_filename)
+        entry = fonts.get(ttf_absolute_filename)
+        if entry is not None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            continue
+        profile_set_unit(ttf_file['filename'], '')
+        start = profile_time()
+        entry = read_font_entry(ttf_absolute_filename)
+        profile_add('font_parse', start)
+        entry['mtime'] = stat.st_mtime
+        entry['size'] = stat.st_size
+        fonts[ttf_absolute_filename] = entry
+        font_index['changed'] = True
+    return font_index
+
+# Read names and cmap coverage of one font, tables are only decompiled when accessed
+def read_font_entry(ttf_absolute_filename):
+    tt = get_tt_font(ttf_absolute_filename)
+    name_table = tt['name']
+    fm = name_table.names[4].string
+    Font = fm.decode('utf-8', errors='replace')
+    Font = re.sub('\x00','',Font)
+
+    coverage = []
+    cmap = tt.getBestCmap() or {}
+    for codepoint in sorted(cmap):
+        if coverage and coverage[-1][1] == codepoint - 1:
+            coverage[-1][1] = codepoint
+        else:
+            coverage.append([codepoint, codepoint])
 
-def rotate_2d_array(arr, degrees):
-    if degrees == 0:
-        new_array = arr
-    elif degrees == 90:
-        new_array = list(zip(*arr[::-1]))
-    elif degrees == 180:
-        new_array = [row[::-1] for row in arr[::-1]]
-    elif degrees == 270:
-        new_array = list(zip(*arr))[::-1]
-    else:
-        raise ValueError("Invalid degrees. Degrees should be 90, 180, or 270.")
-    return new_array
+    entry = {
+        'name': Font,
+        'family': name_table.getDebugName(1),
+        'style': name_table.getDebugName(2),
+        'full_name': name_table.getDebugName(4),
+        'coverage': coverage,
+    }
+    return entry
 
+#---------------------------------------------------------------------------------------
+# Previews
+# Decoded from the packed glyph bytes, so they show exactly what the header or pack contains
+# including variable widths. Nothing is decoded with --no_preview.
+PREVIEW_EXTENSIONS = {'png': ['.png'], 'txt': ['.txt'], 'both': ['.png', '.txt'], 'none': []}
+PREVIEW_COLUMNS = 16
+
+def decode_glyph(bitmap, height, char_width, layout=None, bpp=1):
+    return bitlayout.unpack_dots(bitmap, height, max(char_width, 0), layout, bpp)
+
+# One row of the preview contact sheet with the grid line above it. Glyphs are placed in
+# cells of the character cell width, the part right of a narrower glyph is shaded
+def make_contact_sheet_band(glyph_dots, height, cell_width, columns, bpp=1):
+    max_level = (1 << bpp) - 1
+    band = np.full((height + 1, columns * (cell_width + 1) + 1), 128, dtype=np.uint8)
+    for idx, dots in enumerate(glyph_dots):
+        left = idx * (cell_width + 1) + 1
+        band[1:, left:left + cell_width] = 224
+        band[1:, left:left + dots.shape[1]] = 255 - dots.astype(np.uint16) * 255 // max_level
+    return band
+
+def format_ascii_glyph(glyph, dots, height, bpp=1):
+    lines = [glyph['char'] + ' U+{:04X} width {}'.format(ord(glyph['char']), glyph['width'])]
+    lines += format_char(dots, height, dots.shape[1], 0, bpp)
+    return '\n'.join(lines) + '\n'
+
+# Streaming preview writer of one unit
+# Every glyph is decoded when it is appended, the text dump is written right away and the
+# contact sheet one row of glyphs at a time through a PNG stream
+def open_previews(unit):
+    previews = {'unit': unit, 'files': [], 'png': None, 'txt': None, 'band': [], 'count': 0}
+    char_count = len(unit['chars'])
+    columns = max(min(PREVIEW_COLUMNS, char_count), 1)
+    rows = max((char_count + columns - 1) // columns, 1)
+    for ext in PREVIEW_EXTENSIONS[unit['preview']]:
+        preview_filename = os.path.join(unit['output_bmh_folder'], unit['filename'] + ext)
+        preview_tmp_filename = temp_filename(preview_filename)
+        previews['files'].append((preview_tmp_filename, preview_filename))
+        if ext == '.png':
+            previews['png'] = open_png_stream(preview_tmp_filename, columns * (unit['width'] + 1) + 1, rows * (unit['height'] + 1) + 1)
+            previews['columns'] = columns
+        else:
+            previews['txt'] = open(preview_tmp_filename, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+    return previews
+
+def append_preview(previews, glyph):
+    if not previews['files']:
+        return
+    unit = previews['unit']
+    dots = decode_glyph(glyph['bitmap'], unit['height'], glyph['width'], unit['layout'], unit['bpp'])
+    if previews['txt'] is not None:
+        previews['txt'].write(('\n' if previews['count'] else '') + format_ascii_glyph(glyph, dots, unit['height'], unit['bpp']))
+    if previews['png'] is not None:
+        previews['band'].append(dots)
+        if len(previews['band']) == previews['columns']:
+            flush_preview_band(previews)
+    previews['count'] += 1
+
+def flush_preview_band(previews):
+    unit = previews['unit']
+    write_png_rows(previews['png'], make_contact_sheet_band(previews['band'], unit['height'], unit['width'], previews['columns'], unit['bpp']))
+    previews['band'] = []
+
+# Finish the preview files, returns True if any of them changed
+def close_previews(previews):
+    if previews['txt'] is not None:
+        previews['txt'].close()
+    if previews['png'] is not None:
+        if previews['band'] or previews['count'] == 0:
+            flush_preview_band(previews)
+        unit = previews['unit']
+        write_png_rows(previews['png'], make_contact_sheet_band([], 0, unit['width'], previews['columns']))
+        close_png_stream(previews['png'])
+    changed = False
+    for preview_tmp_filename, preview_filename in previews['files']:
+        changed = replace_if_changed(preview_tmp_filename, preview_filename) or changed
+    return changed
 
-def get_binary_str_array(dot_array, line_width):
-    lines = []
-    template = "{" + f"0:0{line_width}b" + "}"
-    for line in dot_array:
-        binary_str = template.format(int(line))
-        lines.append(list(binary_str))
-    return lines
+#---------------------------------------------------------------------------------------
+# Minimal 8 bit grayscale PNG writer, rows are deflated as they are added so the image
+# never has to be held in memory as a whole
+def open_png_stream(png_filename, width, height):
+    png_file = open(png_filename, 'wb', buffering=WRITE_BUFFER_SIZE)
+    png_file.write(b'\x89PNG\r\n\x1a\n')
+    write_png_chunk(png_file, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+    return {'file': png_file, 'compressor': zlib.compressobj(6)}
+
+# Append rows of a uint8 array, every row is stored with filter type 0 (none)
+def write_png_rows(png_stream, rows):
+    scanlines = np.hstack((np.zeros((rows.shape[0], 1), dtype=np.uint8), rows))
+    data = png_stream['compressor'].compress(scanlines.tobytes())
+    if data:
+        write_png_chunk(png_stream['file'], b'IDAT', data)
+
+def close_png_stream(png_stream):
+    write_png_chunk(png_stream['file'], b'IDAT', png_stream['compressor'].flush())
+    write_png_chunk(png_stream['file'], b'IEND', b'')
+    png_stream['file'].close()
+
+def write_png_chunk(png_file, chunk_type, data):
+    png_file.write(struct.pack('>I', len(data)) + chunk_type + data)
+    png_file.write(struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+#---------------------------------------------------------------------------------------
+# Render all characters side by side into one atlas of dots (True = pixel set), or of
+# gray levels for bpp 2 and 4.
+# A single canvas is reused for drawing, so glyphs are clipped to their cell exactly
+# like a separate image per character would do.
+def render_glyph_atlas(chars, PILfont, width, height, yoffset, bpp=1):
+    if bpp != 1:
+        return quantize_atlas(render_gray_atlas(chars, PILfont, width, height, yoffset), bpp)
+    atlas = np.zeros((height, len(chars) * width), dtype=bool)
+    canvas = Image.new('1', (width, height), color=255)
+    draw = ImageDraw.Draw(canvas)
+    for char_idx, char in enumerate(chars):
+        draw.rectangle((0, 0, width, height), fill=255)
+        draw.text((0, -yoffset), char, font=PILfont)
+        atlas[:, char_idx * width:(char_idx + 1) * width] = ~np.asarray(canvas)
+    return atlas
+
+# Anti-aliased coverage of every pixel, 0 (off) .. 255 (fully covered)
+def render_gray_atlas(chars, PILfont, width, height, yoffset):
+    atlas = np.zeros((height, len(chars) * width), dtype=np.uint8)
+    canvas = Image.new('L', (width, height), color=0)
+    draw = ImageDraw.Draw(canvas)
+    for char_idx, char in enumerate(chars):
+        draw.rectangle((0, 0, width, height), fill=0)
+        draw.text((0, -yoffset), char, font=PILfont, fill=255)
+        atlas[:, char_idx * width:(char_idx + 1) * width] = np.asarray(canvas)
+    return atlas
+
+# Round the coverage of the whole atlas to 2**bpp gray levels at once
+def quantize_atlas(gray_atlas, bpp):
+    max_level = (1 << bpp) - 1
+    return ((gray_atlas.astype(np.uint16) * max_level + 127) // 255).astype(np.uint8)
 
+#---------------------------------------------------------------------------------------
+# Dots of an image (True = pixel set). Arrays, e.g. views into the glyph atlas,
+# already contain dots and are returned unchanged.
+def get_image_dots(image):
+    if isinstance(image, np.ndarray):
+        return image
+    dot_threshold = 127
+    return np.asarray(image.convert('L')) < dot_threshold
 
-def rotate_then_print_ascii_array(dot_array, line_width):
-    arr = get_binary_str_array(dot_array, line_width)
-    rotated = rotate_2d_array(arr, 270)
-    for line in rotated:
-        line = "".join(line)
-        line = line.replace("0", ".")
-        line = line.replace("1", "#")
-        print(line)
+
+def get_binary_str_array(dot_array, line_width):
+    if line_width < 8:
+        template = "{" + f"0:0{line_width}b" + "}"
+        return [list(template.format(int(line))) for line in dot_array]
+    # Bits of all bytes at once, zero padded to line_width digits
+    bits = np.unpackbits(np.frombuffer(bytes(dot_array), dtype=np.uint8).reshape(-1, 1), axis=1)
+    digits = np.where(bits, '1', '0')
+    if line_width > 8:
+        digits = np.hstack((np.full((digits.shape[0], line_width - 8), '0'), digits))
+    return digits.tolist()
 
 
 #---------------------------------------------------------------------------------------
-# Calculate full pixels from image
-def get_pixel_byte(image, height, char_width, x_offset):
-    dot_threshold = 127
-    dot_array = []
-    for y_s in range(int(height/8)):
-        for x_s in range(char_width):
-            dot_byte = 0
-            for k in range(8):
-                bmf_s = image.getpixel(((x_s + x_offset), (y_s * 8 + k)))
-                if(bmf_s < dot_threshold):
-                    dot_byte = dot_byte + 2**k
-            dot_array.append(str(dot_byte))
-    return dot_array
-
-#---------------------------------------------------------------------------------------
-# Count empty columns from left
-def calculate_char_width(image, width, height):
-    dot_threshold = 127
+# Pages of 8 pixel rows per character, the last page of other heights is partially filled
+def get_page_count(height):
+    return (height + 7) // 8
 
-    zero_col_cnt_left = 0
-    for x_c in range(width):
+# Calculate full pixels from image
+# The glyph is packed in one bulk operation, by default every 8 pixel rows form one page,
+# each column of a page becomes one byte with the top pixel in the LSB (SSD1306 order)
+def get_pixel_byte(image, height, char_width, x_offset, layout=None, bpp=1):
+    if(char_width <= 0 or height <= 0):
+        return bytes()
+    dots = get_image_dots(image)[:height, x_offset:x_offset + char_width]
+    return bitlayout.pack_dots(dots, layout, bpp)
 
-        pxl_col_cnt = 0
-        for y_c in range(height):
-            bmf_s = image.getpixel((x_c, y_c))
-            if(bmf_s < dot_threshold):
-                pxl_col_cnt += 1
+#---------------------------------------------------------------------------------------
+# Count empty columns from left and right with one column occupancy reduction
+def calculate_char_width(image, width, height):
+    dots = get_image_dots(image)[:height, :width]
+    occupied = np.flatnonzero(dots.any(axis=0))
 
-        if(pxl_col_cnt == 0):
-            zero_col_cnt_left += 1
-        else:
-            break
-# Count empty columns from left
-    zero_col_cnt_right = 0
-    for x_c in range(width):
-
-        pxl_col_cnt = 0
-        for y_c in range(height):
-            bmf_s = image.getpixel((width-x_c-1, y_c))
-            if(bmf_s < dot_threshold):
-                pxl_col_cnt += 1
-
-        if(pxl_col_cnt == 0):
-            zero_col_cnt_right += 1
-        else:
-            break
+    # Blank glyph (e.g. space): every column counts as empty from both sides
+    if(occupied.size == 0):
+        return [width, width]
 
+    zero_col_cnt_left = int(occupied[0])
+    zero_col_cnt_right = width - 1 - int(occupied[-1])
     return [zero_col_cnt_left, zero_col_cnt_right]
 
 #---------------------------------------------------------------------------------------
 # Read character file
 def read_character_file(char_filename):
-    chars = []
     char_file = open(char_filename,'r', encoding="utf-8")
     character_line = char_file.read().replace("\n", "")
-    [chars.append(x) for x in character_line if x not in chars]
+    return dedup_characters(character_line)
+
+# Characters in order of their first occurrence, one dict lookup per character
+def dedup_characters(character_line):
+    chars = list(dict.fromkeys(character_line))
     character_line = "".join(chars)
 
     return [character_line,chars]
 
+#---------------------------------------------------------------------------------------
+# Character set from the string literals of a source tree
+# Files are scanned one by one (in parallel with --jobs), every worker returns the
+# character counts of one file which are merged in the main process
+C_TOKEN_RE = re.compile(r'''
+    ^[ \t]*\#[ \t]*include[^\n]*                            # include paths are no text
+  | //[^\n]*                                                 # line comment
+  | /\*.*?\*/                                                # block comment
+  | (?<![\w])(?:u8|[uUL])?R"([^ ()\\\t\n]{0,16})\((.*?)\)\1"   # raw string
+  | (?:(?<![\w])(?:u8|[uUL]))?"((?:[^"\\\n]|\\.)*)"           # string
+  | (?<![\w])(?:u8|[uUL])?'(?:[^'\\\n]|\\.)*'                # character literal, no digit separator (1'000)
+''', re.S | re.M | re.X)
+C_ESCAPE_RE = re.compile(r'\\(x[0-9a-fA-F]+|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|[0-7]{1,3}|.)', re.S)
+C_ESCAPES = {'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+PO_STRING_RE = re.compile(r'^(msgid|msgid_plural|msgstr(?:\[\d+\])?)?\s*"((?:[^"\\]|\\.)*)"\s*$')
+
+def decode_c_escapes(literal):
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] in 'xuU':
+            return chr(min(int(escape[1:], 16), 0x10FFFF))
+        if escape[0] in '01234567':
+            return chr(int(escape, 8))
+        return C_ESCAPES.get(escape, escape)
+    return C_ESCAPE_RE.sub(replace, literal)
+
+def get_c_strings(text):
+    for match in C_TOKEN_RE.finditer(text):
+        if match.group(2) is not None:
+            yield match.group(2)
+        elif match.group(3) is not None:
+            yield decode_c_escapes(match.group(3))
+
+def get_json_strings(value):
+    # Values only, keys are identifiers and not displayed
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from get_json_strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from get_json_strings(item)
+
+# Translations of a PO file, msgid if an entry is not translated. The header entry
+# (empty msgid) holds no text
+def get_po_entry_strings(entry):
+    if not ''.join(entry['msgid']):
+        return []
+    if ''.join(entry['msgstr']):
+        return entry['msgstr']
+    return entry['msgid']
+
+def get_po_strings(lines):
+    entry = {'msgid': [], 'msgstr': []}
+    keyword = None
+    for line in lines + ['']:
+        match = PO_STRING_RE.match(line.strip())
+        if match is None:
+            if line.strip() == '' or line.startswith('#'):
+                yield from get_po_entry_strings(entry)
+                entry = {'msgid': [], 'msgstr': []}
+                keyword = None
+            continue
+        if match.group(1) is not None:
+            keyword = 'msgstr' if match.group(1).startswith('msgstr') else 'msgid'
+            if keyword == 'msgid' and entry['msgstr']:
+                # Next entry without blank line in between
+                yield from get_po_entry_strings(entry)
+                entry = {'msgid': [], 'msgstr': []}
+        if keyword is not None:
+            entry[keyword].append(decode_c_escapes(match.group(2)))
+
+def scan_source_file(source_filename):
+    with open(source_filename, 'r', encoding='utf-8', errors='replace') as source_file:
+        text = source_file.read()
+    ext = os.path.splitext(source_filename)[1].lower()
+    if ext == '.json':
+        try:
+            strings = get_json_strings(json.loads(text))
+        except ValueError:
+            strings = get_c_strings(text)
+    elif ext in ('.po', '.pot'):
+        strings = get_po_strings(text.splitlines())
+    else:
+        strings = get_c_strings(text)
+
+    counts = Counter()
+    for string in strings:
+        counts.update(string)
+    # Control characters and undecodable bytes are never rendered
+    for char in [x for x in counts if ord(x) < 32 or ord(x) == 127 or x == '\ufffd']:
+        del counts[char]
+    return counts
+
+def search_source_folder(source_folder):
+    for dirpath, dirnames, filenames in os.walk(source_folder):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in SOURCE_EXTENSIONS:
+                yield os.path.join(dirpath, filename)
+
+def count_source_characters(source_folder, jobs=1):
+    if jobs is None or jobs <= 0:
+        jobs = os.cpu_count() or 1
+    counts = Counter()
+    file_count = 0
+    if jobs <= 1:
+        results = map(scan_source_file, search_source_folder(source_folder))
+        for file_counts in results:
+            counts.update(file_counts)
+            file_count += 1
+    else:
+        with multiprocessing.Pool(jobs) as pool:
+            for file_counts in pool.imap_unordered(scan_source_file, search_source_folder(source_folder), chunksize=16):
+                counts.update(file_counts)
+                file_count += 1
+    return counts, file_count
+
+# Characters of a source tree, most frequent first. Characters used less than
+# rare_threshold times are written to rare_filename instead, if given
+def read_source_characters(source_folder, jobs=1, frequency_filename=None, rare_threshold=0, rare_filename=None):
+    counts, file_count = count_source_characters(source_folder, jobs)
+    ordered = sorted(counts.items(), key=lambda item: (-item[1], ord(item[0])))
+    print('Scanned ' + str(file_count) + ' source files, ' + str(len(ordered)) + ' different characters')
+
+    if frequency_filename is not None:
+        write_char_frequencies(ordered, frequency_filename)
+
+    character_line = "".join(char for char, count in ordered)
+    if rare_filename is not None and rare_threshold > 0:
+        rare_line = "".join(char for char, count in ordered if count < rare_threshold)
+        character_line = "".join(char for char, count in ordered if count >= rare_threshold)
+        with open(rare_filename, 'w', encoding='utf-8') as rare_file:
+            rare_file.write(rare_line + '\n')
+        print(str(len(rare_line)) + ' characters used less than ' + str(rare_threshold) + ' times written to ' + rare_filename)
+    return dedup_characters(character_line)
+
+def write_char_frequencies(ordered, frequency_filename):
+    if frequency_filename.endswith('.json'):
+        write_json_atomic([{'char': char, 'codepoint': ord(char), 'count': count} for char, count in ordered], frequency_filename)
+    else:
+        with open(frequency_filename, 'w', newline='', encoding='utf-8') as frequency_file:
+            writer = csv.writer(frequency_file)
+            writer.writerow(['char', 'codepoint', 'count'])
+            for char, count in ordered:
+                writer.writerow([char, 'U+{:04X}'.format(ord(char)), count])
+
 #---------------------------------------------------------------------------------------
 # Search for TTF Files in given path and create array of files and directories
 def search_ttf_folder(ttf_searchfolder):
@@ -401,9 +1527,9 @@ def search_ttf_folder(ttf_searchfolder):
     return TTF_FILES
 
 #---------------------------------------------------------------------------------------
-def write_bmh_head(h_filename, Font, height):
+def write_bmh_head(h_filename, Font, height, layout=None, bpp=1):
 # Process BMF array and create header file to be used with any C compiler
-    outfile = open(h_filename,"w+")
+    outfile = open(h_filename,"w+", buffering=WRITE_BUFFER_SIZE)
 
     outfile.write("// Header File for SSD1306 characters\n")
     outfile.write("// Generated with TTF2BMH\n")
@@ -411,6 +1537,11 @@ def write_bmh_head(h_filename, Font, height):
 
     #print('Font: ' + Font + ', Size:' + str(height))
     outfile.write("// Font Size: " + str(height) + "\n")
+    if not bitlayout.is_default_layout(layout):
+        outfile.write("// Layout: " + bitlayout.describe_layout(layout) + "\n")
+    if bpp != 1:
+        outfile.write("// Grayscale: " + str(bpp) + " bits per pixel, " + str(8 // bpp) + " pixels per byte, level " + str((1 << bpp) - 1) + " is full on\n")
+        outfile.write("const char char_bpp = " + str(bpp) + ";\n")
     return outfile
 
 #---------------------------------------------------------------------------------------
@@ -424,24 +1555,86 @@ def write_bmh_char(outfile, char, dot_array, progmem):
     else:
         C_declaration_1 = '[] = {'
 
-    C_mem_array = (','.join(dot_array))
+    C_mem_array = (','.join(map(str, dot_array)))
     C_printline = C_declaration_0 + str(ord(char)) + C_declaration_1 + C_mem_array +'};\n'
 
     #print(C_printline)
     outfile.write(C_printline)
 
+#---------------------------------------------------------------------------------------
+# Codepoint lookup tables
+# Characters are sorted by codepoint, char_index maps the sorted position back to the
+# index in char_addr[]/char_width[] and is omitted if the characters are already sorted.
+# Segments are runs of consecutive codepoints, similar to a TrueType cmap format 4.
+def get_codepoint_segments(codepoints):
+    segments = []
+    for position, codepoint in enumerate(codepoints):
+        if segments and segments[-1][1] == codepoint - 1:
+            segments[-1][1] = codepoint
+        else:
+            segments.append([codepoint, codepoint, position])
+    return segments
+
+def get_C_uint_type(max_value):
+    if max_value > 0xFFFF:
+        return 'uint32_t'
+    return 'uint16_t'
+
+def write_bmh_lookup(outfile, character_line, lookup):
+    order = sorted(range(len(character_line)), key=lambda idx: ord(character_line[idx]))
+    codepoints = [ord(character_line[idx]) for idx in order]
+    C_codepoint_type = get_C_uint_type(max(codepoints, default=0))
+    C_index_type = get_C_uint_type(len(codepoints))
+    sorted_chars = order == list(range(len(order)))
+
+    outfile.write('#include <stdint.h>\n')
+    if not sorted_chars:
+        outfile.write('const ' + C_index_type + ' char_index[] = {' + ','.join(map(str, order)) + '};\n')
+    C_result = 'position' if sorted_chars else 'char_index[position]'
+
+    if lookup == 'sorted':
+        outfile.write('const ' + C_codepoint_type + ' char_codepoint[] = {' + ','.join(map(str, codepoints)) + '};\n')
+        outfile.write('// Index of codepoint in char_addr[], -1 if not available\n')
+        outfile.write('static int32_t char_lookup(uint32_t codepoint)\n{\n')
+        outfile.write('    uint32_t low = 0, high = ' + str(len(codepoints)) + ', position;\n')
+        outfile.write('    while (low < high) {\n')
+        outfile.write('        position = (low + high) / 2;\n')
+        outfile.write('        if (char_codepoint[position] < codepoint)\n            low = position + 1;\n')
+        outfile.write('        else\n            high = position;\n    }\n')
+        outfile.write('    position = low;\n')
+        outfile.write('    if (position < ' + str(len(codepoints)) + ' && char_codepoint[position] == codepoint)\n')
+        outfile.write('        return ' + C_result + ';\n')
+        outfile.write('    return -1;\n}\n')
+    else:
+        segments = get_codepoint_segments(codepoints)
+        outfile.write('const ' + C_codepoint_type + ' char_segment_start[] = {' + ','.join(str(seg[0]) for seg in segments) + '};\n')
+        outfile.write('const ' + C_codepoint_type + ' char_segment_end[] = {' + ','.join(str(seg[1]) for seg in segments) + '};\n')
+        outfile.write('const ' + C_index_type + ' char_segment_first[] = {' + ','.join(str(seg[2]) for seg in segments) + '};\n')
+        outfile.write('// Index of codepoint in char_addr[], -1 if not available\n')
+        outfile.write('static int32_t char_lookup(uint32_t codepoint)\n{\n')
+        outfile.write('    uint32_t low = 0, high = ' + str(len(segments)) + ', segment, position;\n')
+        outfile.write('    while (low < high) {\n')
+        outfile.write('        segment = (low + high) / 2;\n')
+        outfile.write('        if (char_segment_end[segment] < codepoint)\n            low = segment + 1;\n')
+        outfile.write('        else\n            high = segment;\n    }\n')
+        outfile.write('    if (low == ' + str(len(segments)) + ' || char_segment_start[low] > codepoint)\n        return -1;\n')
+        outfile.write('    position = char_segment_first[low] + (codepoint - char_segment_start[low]);\n')
+        outfile.write('    return ' + C_result + ';\n}\n')
+
 #---------------------------------------------------------------------------------------
 # Write BMH Tail and close file
-def write_bmh_tail(outfile, width_array, character_line):
+def write_bmh_tail(outfile, width_array, character_line, bitmap_ids=None):
     C_addr_array = []
     C_char_width_0 = 'const char char_width[] = {'
-    C_char_width_1 = (','.join(width_array))
+    C_char_width_1 = (','.join(map(str, width_array)))
     C_char_width_2 = '};\n'
 
     outfile.write(C_char_width_0 + C_char_width_1 + C_char_width_2)
 
-    for char in character_line:
-        C_addr_array.append('&bitmap_' + str(ord(char)))
+    if bitmap_ids is None:
+        bitmap_ids = [ord(char) for char in character_line]
+    for bitmap_id in bitmap_ids:
+        C_addr_array.append('&bitmap_' + str(bitmap_id))
 
     C_addr  = (','.join(C_addr_array))
     C_address_declaration_1 = "const char* char_addr[] = {"
@@ -451,6 +1644,291 @@ def write_bmh_tail(outfile, width_array, character_line):
 
     outfile.close()
 
+#---------------------------------------------------------------------------------------
+# RLE compression of the page bytes of one character
+# Control byte 0nnnnnnn: n+1 literal bytes follow
+# Control byte 1nnnnnnn: the following byte is repeated n+2 times
+def rle_encode(dot_array):
+    encoded = bytearray()
+    literal = bytearray()
+    length = len(dot_array)
+    i = 0
+    while i < length:
+        run = 1
+        while i + run < length and run < 129 and dot_array[i + run] == dot_array[i]:
+            run += 1
+        if run >= 3:
+            rle_flush_literal(encoded, literal)
+            encoded.append(0x80 | (run - 2))
+            encoded.append(dot_array[i])
+        else:
+            literal += dot_array[i:i + run]
+        i += run
+    rle_flush_literal(encoded, literal)
+    return bytes(encoded)
+
+def rle_flush_literal(encoded, literal):
+    for start in range(0, len(literal), 128):
+        chunk = literal[start:start + 128]
+        encoded.append(len(chunk) - 1)
+        encoded += chunk
+    del literal[:]
+
+# Reference decoder, mirrors ttf2bmh_rle_decode() of the C header
+def rle_decode(encoded, size=None):
+    decoded = bytearray()
+    i = 0
+    while i < len(encoded) and (size is None or len(decoded) < size):
+        ctrl = encoded[i]
+        if ctrl & 0x80:
+            decoded += bytes([encoded[i + 1]]) * ((ctrl & 0x7F) + 2)
+            i += 2
+        else:
+            decoded += encoded[i + 1:i + ctrl + 2]
+            i += ctrl + 2
+    return bytes(decoded)
+
+C_RLE_DECODER = '''
+#ifndef TTF2BMH_RLE_DECODER
+#define TTF2BMH_RLE_DECODER
+#ifndef TTF2BMH_READ_BYTE
+#define TTF2BMH_READ_BYTE(p) (*(p))
+#endif
+// Decode the RLE stream of one character directly into a SSD1306 page buffer.
+// dst points to the top left byte of the character in the page buffer,
+// dst_width is the number of bytes per page of the buffer (display width).
+static void ttf2bmh_rle_decode(const uint8_t *src, uint8_t *dst, uint16_t dst_width, int16_t char_width, uint8_t pages)
+{
+    uint16_t remaining;
+    int16_t col = 0;
+    if (char_width <= 0)
+        return;
+    remaining = (uint16_t)char_width * pages;
+    while (remaining) {
+        uint8_t ctrl = TTF2BMH_READ_BYTE(src++);
+        uint8_t repeat = ctrl & 0x80;
+        uint8_t count = repeat ? (ctrl & 0x7F) + 2 : ctrl + 1;
+        uint8_t value = repeat ? TTF2BMH_READ_BYTE(src++) : 0;
+        while (count-- && remaining) {
+            dst[col] = repeat ? value : TTF2BMH_READ_BYTE(src++);
+            remaining--;
+            if (++col == char_width) {
+                col = 0;
+                dst += dst_width;
+            }
+        }
+    }
+}
+#endif
+'''
+
+#---------------------------------------------------------------------------------------
+# RLE stream of all characters, kept as C initializer text in a temporary file until the
+# tail is written, so the compressed bytes need not be held in memory
+def open_rle_spill():
+    return {'file': tempfile.TemporaryFile('w+'), 'size': 0}
+
+# Append encoded bytes, returns their offset within the stream
+def append_rle_spill(rle_spill, data):
+    rle_offset = rle_spill['size']
+    if data:
+        rle_spill['file'].write((',' if rle_offset else '') + ','.join(map(str, data)))
+    rle_spill['size'] += len(data)
+    return rle_offset
+
+# Write BMH Tail for RLE compressed characters and close file
+def write_bmh_rle_tail(outfile, width_array, rle_spill, offsets, height, progmem, layout=None, bpp=1):
+    if(progmem):
+        C_progmem = ' PROGMEM'
+    else:
+        C_progmem = ''
+    if rle_spill['size'] > 0xFFFF:
+        C_offset_type = 'uint32_t'
+    else:
+        C_offset_type = 'uint16_t'
+
+    outfile.write('#include <stdint.h>\n')
+    if(progmem):
+        outfile.write('#ifndef TTF2BMH_READ_BYTE\n#define TTF2BMH_READ_BYTE(p) pgm_read_byte(p)\n#endif\n')
+    if bitlayout.is_default_layout(layout) and bpp == 1:
+        outfile.write('// RLE compressed characters, ' + str(get_page_count(height)) + ' pages per character\n')
+    else:
+        outfile.write('// RLE compressed characters, ' + bitlayout.describe_layout(layout) + ', decode with char_width = char_row_bytes[i] and pages = char_rows[i]\n')
+    outfile.write('const uint8_t bitmap_rle[]' + C_progmem + ' = {')
+    rle_spill['file'].seek(0)
+    copyfileobj(rle_spill['file'], outfile, WRITE_BUFFER_SIZE)
+    rle_spill['file'].close()
+    outfile.write('};\n')
+    outfile.write('const ' + C_offset_type + ' char_offset[] = {' + ','.join(map(str, offsets)) + '};\n')
+    outfile.write('const char char_width[] = {' + ','.join(map(str, width_array)) + '};\n')
+    if not (bitlayout.is_default_layout(layout) and bpp == 1):
+        # The decoder copies rows of bytes, their size differs from the pixel width in other layouts
+        packed_shapes = [bitlayout.get_packed_shape(height, char_width, layout, bpp) for char_width in width_array]
+        C_rows_type = 'uint8_t' if max([rows for rows, _ in packed_shapes] + [0]) <= 0xFF else 'uint16_t'
+        outfile.write('const ' + C_rows_type + ' char_rows[] = {' + ','.join(str(rows) for rows, _ in packed_shapes) + '};\n')
+        outfile.write('const int16_t char_row_bytes[] = {' + ','.join(str(row_bytes) for _, row_bytes in packed_shapes) + '};\n')
+    outfile.write(C_RLE_DECODER)
+
+    outfile.close()
+
+#---------------------------------------------------------------------------------------
+# Binary font pack
+# Little endian file, all sections are 4 byte aligned:
+#   header          see PACK_HEADER_FORMAT and C_PACK_HEADER
+#   codepoints      uint32 per character, sorted ascending
+#   offsets         uint32 per character, offset of its page bytes within the data section
+#   widths          int16 per character
+#   data            packed bytes of all characters, the size of a character follows from its
+#                   width, the height and the layout and bit depth in the flags, see
+#                   bitlayout.get_packed_size()
+C_PACK_HEADER = '''// Binary font pack generated with TTF2BMH
+#ifndef TTF2BMH_PACK_H
+#define TTF2BMH_PACK_H
+#include <stdint.h>
+
+#define TTF2BMH_PACK_MAGIC "BMHP"
+#define TTF2BMH_PACK_FLAG_VARIABLE_WIDTH 0x0001
+#define TTF2BMH_PACK_FLAG_HORIZONTAL 0x0002     // rows of pixels instead of vertical pages
+#define TTF2BMH_PACK_FLAG_MSB 0x0004            // first pixel of a byte in the MSB
+#define TTF2BMH_PACK_ROTATION(flags) ((((flags) >> 3) & 3) * 90)
+#define TTF2BMH_PACK_BPP(flags) (1 << (((flags) >> 5) & 3))
+
+// Bytes of a character of width w = widths[i] (none if w <= 0) and h = height, w and h
+// swapped for rotation 90 and 270, ppb = 8 / bpp pixels per byte:
+//   vertical     (h + ppb - 1) / ppb rows of w bytes (pages * w bytes for 1 bpp, rotation 0)
+//   horizontal   h rows of (w + ppb - 1) / ppb bytes
+// All fields little endian, section offsets relative to the start of the file
+typedef struct {
+    char magic[4];
+    uint16_t version;
+    uint16_t header_size;
+    uint16_t height;
+    uint16_t width;
+    uint16_t pages;
+    uint16_t flags;
+    uint32_t char_count;
+    uint32_t codepoint_offset;  // uint32_t codepoints[char_count], sorted
+    uint32_t bitmap_offset;     // uint32_t offsets[char_count] into data section
+    uint32_t width_offset;      // int16_t widths[char_count]
+    uint32_t data_offset;       // packed bytes of all characters, sizes see above
+    uint32_t data_size;
+} ttf2bmh_pack_header_t;
+
+#endif
+'''
+
+def pack_align(offset):
+    return (offset + 3) & ~3
+
+def write_pack_C_header(C_header_filename):
+    tmp_filename = temp_filename(C_header_filename)
+    with open(tmp_filename, 'w') as C_header_file:
+        C_header_file.write(C_PACK_HEADER)
+    replace_if_changed(tmp_filename, C_header_filename)
+
+# Pack flags of a bit layout and back
+def get_pack_layout_flags(layout):
+    layout = bitlayout.parse_layout(layout)
+    flags = 0x0002 if layout['order'] == 'horizontal' else 0
+    flags |= 0x0004 if layout['bit_order'] == 'msb' else 0
+    return flags | (layout['rotation'] // 90) << 3
+
+def get_pack_layout(flags):
+    order = 'horizontal' if flags & 0x0002 else 'vertical'
+    bit_order = 'msb' if flags & 0x0004 else 'lsb'
+    return order + '-' + bit_order + '-' + str(((flags >> 3) & 3) * 90)
+
+# Section offsets of a pack, they only depend on the number of characters
+def get_pack_section_offsets(char_count):
+    header_size = struct.calcsize(PACK_HEADER_FORMAT)
+    codepoint_offset = pack_align(header_size)
+    bitmap_offset = pack_align(codepoint_offset + 4 * char_count)
+    width_offset = pack_align(bitmap_offset + 4 * char_count)
+    data_offset = pack_align(width_offset + 2 * char_count)
+    return [header_size, codepoint_offset, bitmap_offset, width_offset, data_offset]
+
+# Streaming pack writer
+# The data section starts at a known offset, so glyph bytes are appended as they are
+# rendered and the header and tables are filled in when the writer is closed
+def open_bmh_pack_writer(pack_filename, char_count):
+    section_offsets = get_pack_section_offsets(char_count)
+    pack_file = open(pack_filename, 'wb', buffering=WRITE_BUFFER_SIZE)
+    pack_file.write(bytes(section_offsets[-1]))
+    return {'file': pack_file, 'section_offsets': section_offsets, 'data_size': 0}
+
+# Append page bytes to the data section, returns their offset within the section
+def append_bmh_pack_data(pack_writer, data):
+    data_offset = pack_writer['data_size']
+    pack_writer['file'].write(data)
+    pack_writer['data_size'] += len(data)
+    return data_offset
+
+def close_bmh_pack_writer(pack_writer, character_line, width_array, bitmap_offsets, width, height, variable_width, layout=None, bpp=1):
+    order = sorted(range(len(character_line)), key=lambda idx: ord(character_line[idx]))
+    char_count = len(order)
+    codepoints = np.array([ord(character_line[idx]) for idx in order], dtype='<u4')
+    offsets = np.array([bitmap_offsets[idx] for idx in order], dtype='<u4')
+    widths = np.array([int(width_array[idx]) for idx in order], dtype='<i2')
+
+    [header_size, codepoint_offset, bitmap_offset, width_offset, data_offset] = pack_writer['section_offsets']
+    flags = (1 if variable_width else 0) | get_pack_layout_flags(layout) | (bpp.bit_length() - 1) << 5
+
+    header = struct.pack(PACK_HEADER_FORMAT, PACK_MAGIC, PACK_VERSION, header_size,
+                         height, width, get_page_count(height), flags, char_count,
+                         codepoint_offset, bitmap_offset, width_offset, data_offset, pack_writer['data_size'])
+    pack_file = pack_writer['file']
+    for section_offset, section in [(0, header), (codepoint_offset, codepoints.tobytes()),
+                                    (bitmap_offset, offsets.tobytes()), (width_offset, widths.tobytes())]:
+        pack_file.seek(section_offset)
+        pack_file.write(section)
+    pack_file.close()
+
+# Open binary font pack via mmap, tables are numpy views and glyphs memoryview slices
+# of the mapped file, nothing is copied
+def read_bmh_pack(pack_filename):
+    with open(pack_filename, 'rb') as pack_file:
+        mapped = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+    fields = struct.unpack_from(PACK_HEADER_FORMAT, mapped)
+    (magic, version, header_size, height, width, pages, flags, char_count,
+     codepoint_offset, bitmap_offset, width_offset, data_offset, data_size) = fields
+    if magic != PACK_MAGIC or version != PACK_VERSION:
+        mapped.close()
+        raise ValueError(pack_filename + ' is no TTF2BMH font pack of version ' + str(PACK_VERSION))
+    return {
+        'mmap': mapped,
+        'height': height,
+        'width': width,
+        'pages': pages,
+        'variable_width': bool(flags & 1),
+        'layout': get_pack_layout(flags),
+        'bpp': 1 << ((flags >> 5) & 3),
+        'codepoints': np.frombuffer(mapped, dtype='<u4', count=char_count, offset=codepoint_offset),
+        'offsets': np.frombuffer(mapped, dtype='<u4', count=char_count, offset=bitmap_offset),
+        'widths': np.frombuffer(mapped, dtype='<i2', count=char_count, offset=width_offset),
+        'data': memoryview(mapped)[data_offset:data_offset + data_size],
+    }
+
+# Width and page bytes of one character, None if the pack does not contain it
+def get_pack_char(pack, char):
+    codepoints = pack['codepoints']
+    idx = int(np.searchsorted(codepoints, ord(char)))
+    if idx == len(codepoints) or codepoints[idx] != ord(char):
+        return None
+    char_width = int(pack['widths'][idx])
+    offset = int(pack['offsets'][idx])
+    return char_width, pack['data'][offset:offset + bitlayout.get_packed_size(pack['height'], char_width, pack['layout'], pack['bpp'])]
+
+# Slices returned by get_pack_char() keep the mapping open, if the caller still holds one
+# the file is unmapped when the last of them is released
+def close_bmh_pack(pack):
+    for key in ('codepoints', 'offsets', 'widths'):
+        pack[key] = None
+    pack['data'].release()
+    try:
+        pack['mmap'].close()
+    except BufferError:
+        pass
+
 #---------------------------------------------------------------------------------------
 #
 def logfile_open(ttf_searchfolder):
@@ -461,10 +1939,20 @@ def logfile_open(ttf_searchfolder):
     log_file.write('====================================================================\n')
     return log_file
 
+#---------------------------------------------------------------------------------------
+# Append manifest job to Logfile
+def logfile_append_job(log_file, name):
+    log_file.write('--- ' + name + '\n')
+
 #---------------------------------------------------------------------------------------
 # Append Font name to Logfile
-def logfile_append(log_file, filename):
-    log_file.write(filename + '.h\n')
+def logfile_append(log_file, filename, ext='.h'):
+    log_file.write(filename + ext + '\n')
+
+#---------------------------------------------------------------------------------------
+# Append failed conversion to Logfile
+def logfile_append_error(log_file, filename, error, ext='.h'):
+    log_file.write(filename + ext + ' FAILED: ' + error + '\n')
 
 #---------------------------------------------------------------------------------------
 # close Logfile
@@ -473,25 +1961,20 @@ def logfile_close(log_file):
     log_file.close()
 
 
-def format_char(image, height, char_width, x_offset):
-    dot_threshold = 128
-    ascii_bmps = []
-    for y_s in range(height):
-        ascii_bmp = ''
-        for x_s in range(char_width):
-            bmf_s = image.getpixel(((x_s + x_offset), y_s))
-            if (bmf_s < dot_threshold):
-                ascii_bmp = ascii_bmp + '#'
-            else:
-                ascii_bmp = ascii_bmp + '.'
-        ascii_bmps.append(ascii_bmp)
-    return ascii_bmps
+def format_char(image, height, char_width, x_offset, bpp=1):
+    dots = get_image_dots(image)[:height, x_offset:x_offset + max(char_width, 0)]
+    if bpp == 1:
+        ascii_art = np.where(dots, '#', '.')
+    else:
+        # Gray levels from '.' (off) to '#' (full on)
+        ascii_art = np.array(list(GRAY_SHADES[bpp]))[dots]
+    return [''.join(line) for line in ascii_art]
 
 
 #---------------------------------------------------------------------------------------
 # print pixel array as ASCII Art
-def print_char(image, height, char_width, x_offset):
-    ascii_bmps = format_char(image, height, char_width, x_offset)
+def print_char(image, height, char_width, x_offset, bpp=1):
+    ascii_bmps = format_char(image, height, char_width, x_offset, bpp)
     for ascii_bmp in ascii_bmps:
         print(ascii_bmp)
     print(' ')
@@ -502,4 +1985,4 @@ def print_char(image, height, char_width, x_offset):
 # Main function handler
 
 if (__name__ == '__main__'):
-    main()
+    sys.exit(main())
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# ttf2bmh, img2pixels and bitlayout are plain scripts in src/
+BASE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_FOLDER, 'src'))
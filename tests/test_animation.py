@@ -0,0 +1,67 @@
+# Animation keyframe and delta encoding reconstructs every frame
+import io
+import re
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import img2pixels
+
+
+def make_frames(count, size, changes):
+    rng = np.random.default_rng(count)
+    frame = rng.integers(0, 256, size, dtype=np.uint8)
+    frames = []
+    for _ in range(count):
+        frame = frame.copy()
+        frame[rng.integers(0, size, changes)] = rng.integers(0, 256, changes, dtype=np.uint8)
+        frames.append(frame.tobytes())
+    return frames
+
+
+def make_gif(count):
+    images = []
+    for frame_index in range(count):
+        dots = np.zeros((32, 64), dtype=bool)
+        dots[8:24, frame_index * 4:frame_index * 4 + 12] = True
+        images.append(Image.fromarray(np.where(dots, 0, 255).astype(np.uint8)).convert('RGB'))
+    gif_file = io.BytesIO()
+    images[0].save(gif_file, format='GIF', save_all=True, append_images=images[1:], duration=50, disposal=1)
+    gif_file.seek(0)
+    return gif_file
+
+
+@pytest.mark.parametrize('keyframe_interval', [0, 1, 4])
+@pytest.mark.parametrize('changes', [0, 3, 400])
+def test_play_animation_round_trip(keyframe_interval, changes):
+    frames = make_frames(12, 1024, changes)
+    encoded = list(img2pixels.encode_animation(frames, keyframe_interval))
+    assert list(img2pixels.play_animation(encoded)) == frames
+    assert encoded[0][0] == img2pixels.ANIMATION_KEYFRAME
+    for frame_index, (frame_type, data) in enumerate(encoded):
+        if keyframe_interval and frame_index % keyframe_interval == 0:
+            assert frame_type == img2pixels.ANIMATION_KEYFRAME
+        if frame_type == img2pixels.ANIMATION_DELTA:
+            assert len(data) < len(frames[frame_index])
+
+
+def test_long_delta_spans():
+    previous = bytes(2000)
+    current = bytes(100) + b'\x01' * 600 + bytes(1300)
+    assert img2pixels.apply_delta(previous, img2pixels.encode_delta(previous, current)) == current
+
+
+@pytest.mark.parametrize('layout', [None, 'vertical-lsb'])
+def test_convert_animation_header(layout):
+    out_file = io.StringIO()
+    stats = img2pixels.convert_animation(make_gif(8), out_file, 2, 1, 8, 180, 'anim', 0, layout)
+    arrays = {name: [int(value) for value in values.split(',')]
+              for name, values in re.findall(r'const unsigned \w+ (\w+)\[\] = \{([0-9,]*)\};', out_file.getvalue())}
+    frame_types = arrays['anim_keyframe']
+    encoded = [(frame_type, bytes(arrays['anim_%04d' % idx][:arrays['anim_length'][idx]]))
+               for idx, frame_type in enumerate(frame_types)]
+    expected = list(img2pixels.iter_animation_frames(Image.open(make_gif(8)), 2, 1, 8, 180, layout))
+    assert stats['frames'] == len(expected) == 8
+    assert list(img2pixels.play_animation(encoded)) == expected
+    assert stats['keyframes'] == frame_types.count(img2pixels.ANIMATION_KEYFRAME) < stats['frames']
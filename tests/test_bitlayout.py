@@ -0,0 +1,75 @@
+# Pack and unpack of all bit layouts and bit depths with sizes that are no multiple of a byte
+import itertools
+
+import numpy as np
+import pytest
+
+import bitlayout
+
+LAYOUTS = [order + '-' + bit_order + '-' + str(rotation)
+           for order, bit_order, rotation in itertools.product(bitlayout.LAYOUT_ORDERS, ['lsb', 'msb'], bitlayout.LAYOUT_ROTATIONS)]
+SIZES = [(1, 1), (5, 3), (7, 9), (8, 8), (13, 6), (16, 11)]
+
+
+def random_dots(height, width, bpp, seed):
+    rng = np.random.default_rng(seed)
+    if bpp == 1:
+        return rng.random((height, width)) < 0.5
+    return rng.integers(0, 2**bpp, size=(height, width), dtype=np.uint8)
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+@pytest.mark.parametrize('bpp', bitlayout.BPP_VALUES)
+@pytest.mark.parametrize('height,width', SIZES)
+def test_pack_unpack_round_trip(layout, bpp, height, width):
+    dots = random_dots(height, width, bpp, height * 100 + width)
+    data = bitlayout.pack_dots(dots, layout, bpp)
+    assert len(data) == bitlayout.get_packed_size(height, width, layout, bpp)
+    np.testing.assert_array_equal(bitlayout.unpack_dots(data, height, width, layout, bpp), dots)
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+@pytest.mark.parametrize('bpp', bitlayout.BPP_VALUES)
+def test_rotation_is_applied_before_packing(layout, bpp):
+    dots = random_dots(7, 10, bpp, 1)
+    parsed = bitlayout.parse_layout(layout)
+    unrotated = parsed['order'] + '-' + parsed['bit_order']
+    rotated_dots = bitlayout.rotate_dots(dots, parsed['rotation'])
+    assert bitlayout.pack_dots(dots, layout, bpp) == bitlayout.pack_dots(rotated_dots, unrotated, bpp)
+
+
+# A single full level pixel in the top left corner lands in the first byte, in the low
+# bits for lsb and in the high bits for msb
+@pytest.mark.parametrize('order', bitlayout.LAYOUT_ORDERS)
+@pytest.mark.parametrize('bpp', bitlayout.BPP_VALUES)
+@pytest.mark.parametrize('bit_order', ['lsb', 'msb'])
+def test_top_left_pixel_byte(order, bit_order, bpp):
+    level = 2**bpp - 1
+    dots = np.zeros((11, 9), dtype=bool if bpp == 1 else np.uint8)
+    dots[0, 0] = level
+    data = bitlayout.pack_dots(dots, order + '-' + bit_order, bpp)
+    expected = level if bit_order == 'lsb' else level << (8 - bpp)
+    assert data[0] == expected
+    assert not any(data[1:])
+
+
+@pytest.mark.parametrize('layout,expected', [
+    ('vertical-lsb', [0x01, 0x00, 0x00, 0x00]),
+    ('vertical-msb', [0x80, 0x00, 0x00, 0x00]),
+    ('horizontal-msb', [0x80, 0x00, 0x00, 0x00]),
+    ('horizontal-lsb', [0x01, 0x00, 0x00, 0x00]),
+    ('vertical-lsb-90', [0x00, 0x00, 0x00, 0x01]),
+    ('vertical-lsb-180', [0x00, 0x00, 0x00, 0x08]),
+    ('horizontal-msb-270', [0x00, 0x00, 0x00, 0x80]),
+])
+def test_known_bytes(layout, expected):
+    # 4 x 4 bitmap with the top left pixel set
+    dots = np.zeros((4, 4), dtype=bool)
+    dots[0, 0] = True
+    assert list(bitlayout.pack_dots(dots, layout)) == expected
+
+
+def test_empty_bitmap():
+    assert bitlayout.pack_dots(np.zeros((0, 5), dtype=bool)) == b''
+    assert bitlayout.get_packed_size(0, 5) == 0
+    assert bitlayout.unpack_dots(b'', 0, 5).shape == (0, 5)
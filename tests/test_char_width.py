@@ -0,0 +1,61 @@
+# Vectorized column trimming of calculate_char_width against the original getpixel() loops
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+import ttf2bmh
+
+BASE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT_FILE = os.path.join(BASE_FOLDER, 'fonts', '8x8.ttf')
+ASCII_LINE = " !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~"
+
+
+def reference_char_width(image, width, height):
+    dot_threshold = 127
+
+    zero_col_cnt_left = 0
+    for x_c in range(width):
+        pxl_col_cnt = 0
+        for y_c in range(height):
+            if(image.getpixel((x_c, y_c)) < dot_threshold):
+                pxl_col_cnt += 1
+        if(pxl_col_cnt == 0):
+            zero_col_cnt_left += 1
+        else:
+            break
+
+    zero_col_cnt_right = 0
+    for x_c in range(width):
+        pxl_col_cnt = 0
+        for y_c in range(height):
+            if(image.getpixel((width-x_c-1, y_c)) < dot_threshold):
+                pxl_col_cnt += 1
+        if(pxl_col_cnt == 0):
+            zero_col_cnt_right += 1
+        else:
+            break
+
+    return [zero_col_cnt_left, zero_col_cnt_right]
+
+
+@pytest.mark.parametrize('height', ttf2bmh.FONT_HEIGHTS)
+def test_rendered_glyphs_match_reference(height):
+    [width, yoffset, font_height] = ttf2bmh.get_size_parameters(height)
+    PILfont = ImageFont.truetype(FONT_FILE, font_height)
+    font = ttf2bmh.render_font(FONT_FILE, height, ASCII_LINE, variable_width=True)
+    for glyph in font['glyphs']:
+        image = Image.new('1', (width, height), color=255)
+        ImageDraw.Draw(image).text((0, -yoffset), glyph['char'], font=PILfont)
+        [left, right] = reference_char_width(image, width, height)
+        assert ttf2bmh.calculate_char_width(image, width, height) == [left, right], glyph['char']
+        assert (glyph['x_offset'], glyph['width']) == (left, width - left - right), glyph['char']
+
+
+@pytest.mark.parametrize('columns', [[], [0], [11], [0, 11], [3, 4, 8]])
+def test_set_columns_match_reference(columns):
+    dots = np.zeros((16, 12), dtype=bool)
+    dots[5, columns] = True
+    image = Image.fromarray(np.where(dots, 0, 255).astype(np.uint8)).convert('1')
+    assert ttf2bmh.calculate_char_width(image, 12, 16) == reference_char_width(image, 12, 16)
@@ -0,0 +1,60 @@
+# Bulk grid sampling of img2pixels against the per cell ImageStat median of the original code
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageStat
+
+import img2pixels
+
+BASE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_IMAGES = [
+    # filename, horizontal grids, vertical grids, pieces per block
+    ('creature.png', 1, 1, 5),
+    ('monochrome_grid_size_25.png', 1, 1, 9),
+    ('multiple_test.png', 3, 3, 9),
+]
+
+
+def reference_rotate_2d_array(arr, degrees):
+    if degrees == 0:
+        new_array = arr
+    elif degrees == 90:
+        new_array = list(zip(*arr[::-1]))
+    elif degrees == 180:
+        new_array = [row[::-1] for row in arr[::-1]]
+    elif degrees == 270:
+        new_array = list(zip(*arr))[::-1]
+    return new_array
+
+
+def reference_grid2array(img, num_columns, rotation=180):
+    pixel_size = img.width // num_columns
+    num_lines = img.height // pixel_size
+    blocks = [[] for _ in range(num_columns)]
+    for x in range(num_columns):
+        for y in range(num_lines):
+            target = img.crop((x * pixel_size, y * pixel_size, (x + 1) * pixel_size, (y + 1) * pixel_size))
+            grayscale = sum(ImageStat.Stat(target).median) / 3
+            blocks[x].append(1 if grayscale < 125 else 0)
+    rotated_str_array = ["".join([str(char) for char in line]) for line in reference_rotate_2d_array(blocks, rotation)]
+    rotated_verbose_str = ""
+    for line in rotated_str_array:
+        rotated_verbose_str += "%s\n" % line.replace("0", "░░").replace("1", "██")
+    return [int(line, base=2) for line in rotated_str_array], rotated_verbose_str
+
+
+@pytest.mark.parametrize('rotation', [0, 90, 180, 270])
+@pytest.mark.parametrize('filename,num_hor,num_vec,num_columns', TEST_IMAGES)
+def test_test_images_match_reference(filename, num_hor, num_vec, num_columns, rotation):
+    img = Image.open(os.path.join(BASE_FOLDER, 'test_images', filename))
+    for line in img2pixels.get_grids(img, num_hor, num_vec):
+        for grid in line:
+            assert img2pixels.parse_single_grid2array(grid, num_columns, rotation) == reference_grid2array(grid, num_columns, rotation)
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'L', '1'])
+def test_random_sheet_matches_reference(mode):
+    rng = np.random.default_rng(2)
+    img = Image.fromarray(rng.integers(0, 256, (84, 60, 3), dtype=np.uint8)).convert(mode)
+    assert img2pixels.parse_single_grid2array(img, 10) == reference_grid2array(img, 10)
@@ -0,0 +1,74 @@
+# img2pixels conversion service on localhost against the in-process conversion
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from PIL import Image
+
+import img2pixels
+
+BASE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_FILE = os.path.join(BASE_FOLDER, 'test_images', 'multiple_test.png')
+
+
+@pytest.fixture
+def server_url():
+    server = img2pixels.make_http_server(port=0, cache_size=4)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://%s:%d' % server.server_address[:2]
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, data=None):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, method='POST' if data is not None else 'GET')) as response:
+            return response.status, response.read().decode('utf-8')
+    except urllib.error.HTTPError as error:
+        return error.code, error.read().decode('utf-8')
+
+
+def read_image_bytes():
+    with open(IMAGE_FILE, 'rb') as image_file:
+        return image_file.read()
+
+
+def test_header_matches_format_output(server_url):
+    status, body = request(server_url + '/convert?num_horizontal_grids=3&num_vertical_grids=3&num_hor_pieces_per_block=9', read_image_bytes())
+    grids = img2pixels.get_grids(Image.open(IMAGE_FILE), 3, 3)
+    assert status == 200
+    assert body == img2pixels.format_output(grids, 9, 180, False, 'custom_bitmap')
+
+
+def test_json_matches_parse_single_grid2array(server_url):
+    status, body = request(server_url + '/convert?num_horizontal_grids=3&num_vertical_grids=3&num_hor_pieces_per_block=9'
+                           '&rotation=90&layout=vertical-lsb&format=json', read_image_bytes())
+    result = json.loads(body)
+    grids = img2pixels.get_grids(Image.open(IMAGE_FILE), 3, 3)
+    assert status == 200
+    assert result['width'] == 9
+    assert [bitmap['data'] for bitmap in result['bitmaps']] == [
+        img2pixels.parse_single_grid2array(grid, 9, 90, 'vertical-lsb')[0] for line in grids for grid in line]
+
+
+def test_cache_and_metrics(server_url):
+    url = server_url + '/convert?num_horizontal_grids=3&num_vertical_grids=3&num_hor_pieces_per_block=9'
+    first = request(url, read_image_bytes())
+    second = request(url, read_image_bytes())
+    status, body = request(server_url + '/metrics')
+    metrics = json.loads(body)
+    assert first == second
+    assert status == 200
+    assert (metrics['requests'], metrics['cache_hits'], metrics['cache_misses'], metrics['errors']) == (2, 1, 1, 0)
+
+
+def test_invalid_parameters(server_url):
+    status, body = request(server_url + '/convert?rotation=45', read_image_bytes())
+    assert status == 400
+    assert 'error' in json.loads(body)
+    assert request(server_url + '/unknown')[0] == 404
+    assert json.loads(request(server_url + '/metrics')[1])['errors'] == 1
@@ -0,0 +1,47 @@
+# Manifest jobs are parsed like the command line
+import json
+import os
+import subprocess
+import sys
+
+BASE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT_FOLDER = os.path.join(BASE_FOLDER, 'fonts')
+SCRIPT = os.path.join(BASE_FOLDER, 'src', 'ttf2bmh.py')
+
+
+def run_manifest(tmp_path, manifest):
+    manifest_filename = tmp_path / 'jobs.json'
+    manifest_filename.write_text(json.dumps(manifest))
+    return subprocess.run([sys.executable, SCRIPT, '--manifest', str(manifest_filename)],
+                          cwd=str(tmp_path), capture_output=True, text=True)
+
+
+def test_values_starting_with_dash(tmp_path):
+    result = run_manifest(tmp_path, {
+        'defaults': {'ttf_folder': FONT_FOLDER, 'output_folder': str(tmp_path / 'out'), 'no_preview': True},
+        'jobs': [{'characters': '-+0', 'fontsize': 8}, {'characters': '--x', 'fontsize': 8, 'offset': -1}],
+    })
+    assert result.returncode == 0, result.stderr
+    assert 'Converting characters: "-+0"' in result.stdout
+    assert 'Converting characters: "-x"' in result.stdout
+    assert os.path.exists(tmp_path / 'out' / 'ttf2bmh.log')
+    assert not os.path.exists(tmp_path / 'bmh_fonts')
+
+
+def test_false_keeps_flag_off(tmp_path):
+    result = run_manifest(tmp_path, {
+        'defaults': {'ttf_folder': FONT_FOLDER, 'output_folder': str(tmp_path / 'out')},
+        'jobs': [{'characters': '0', 'fontsize': 8, 'variable_width': False, 'dedup': False}],
+    })
+    assert result.returncode == 0, result.stderr
+
+
+def test_false_cannot_switch_off_defaults(tmp_path):
+    result = run_manifest(tmp_path, {
+        'defaults': {'ttf_folder': FONT_FOLDER, 'output_folder': str(tmp_path / 'out'), 'variable_width': True},
+        'jobs': [{'characters': '0', 'fontsize': 8}, {'characters': '1', 'fontsize': 8, 'variable_width': False}],
+    })
+    assert result.returncode == 2
+    assert 'variable_width: false cannot switch off' in result.stderr
+    # Nothing is converted if any job is invalid
+    assert not os.path.exists(tmp_path / 'out')
@@ -0,0 +1,44 @@
+# Binary font packs written by the command line read back like render_font() renders them
+import os
+import subprocess
+import sys
+
+import pytest
+
+import ttf2bmh
+
+BASE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT_FOLDER = os.path.join(BASE_FOLDER, 'fonts')
+FONT_FILE = os.path.join(FONT_FOLDER, '8x8.ttf')
+SCRIPT = os.path.join(BASE_FOLDER, 'src', 'ttf2bmh.py')
+CHARACTERS = 'zaA 0b:.!W~'
+
+
+def write_pack(tmp_path, height, options):
+    subprocess.run([sys.executable, SCRIPT, '-s', str(height), '-C', CHARACTERS, '--output_format', 'pack',
+                    '--no_preview', '-f', FONT_FOLDER, '-o', str(tmp_path)] + options, check=True, capture_output=True)
+    [pack_filename] = [os.path.join(root, name) for root, _, names in os.walk(tmp_path) for name in names if name.endswith('.bin')]
+    return pack_filename
+
+
+@pytest.mark.parametrize('height,layout,bpp', [(8, 'vertical-lsb', 1), (24, 'horizontal-msb', 4), (20, 'horizontal-lsb-90', 2), (24, 'vertical-msb-270', 1)])
+def test_pack_matches_render_font(tmp_path, height, layout, bpp):
+    pack = ttf2bmh.read_bmh_pack(write_pack(tmp_path, height, ['--variable_width', '--dedup', '--layout', layout, '--bpp', str(bpp)]))
+    font = ttf2bmh.render_font(FONT_FILE, height, CHARACTERS, variable_width=True, layout=layout, bpp=bpp)
+    assert (pack['height'], pack['width'], pack['variable_width'], pack['bpp']) == (height, font['width'], True, bpp)
+    assert pack['layout'] == ttf2bmh.bitlayout.format_layout(layout)
+    assert list(pack['codepoints']) == sorted(ord(char) for char in CHARACTERS)
+    for glyph in font['glyphs']:
+        char_width, data = ttf2bmh.get_pack_char(pack, glyph['char'])
+        assert char_width == glyph['width']
+        assert bytes(data) == glyph['bitmap'], glyph['char']
+    assert ttf2bmh.get_pack_char(pack, '一') is None
+    ttf2bmh.close_bmh_pack(pack)
+
+
+def test_close_with_held_glyph(tmp_path):
+    pack = ttf2bmh.read_bmh_pack(write_pack(tmp_path, 8, []))
+    char_width, data = ttf2bmh.get_pack_char(pack, 'A')
+    ttf2bmh.close_bmh_pack(pack)
+    assert bytes(data) == ttf2bmh.render_font(FONT_FILE, 8, 'A')['glyphs'][0]['bitmap']
+    data.release()
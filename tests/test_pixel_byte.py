@@ -0,0 +1,50 @@
+# Bulk packing of get_pixel_byte against the per pixel getpixel() loop of the original code
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+import ttf2bmh
+
+BASE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT_FILE = os.path.join(BASE_FOLDER, 'fonts', '8x8.ttf')
+ASCII_LINE = " !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~"
+
+
+def reference_pixel_byte(image, height, char_width, x_offset):
+    dot_threshold = 127
+    dot_array = []
+    for y_s in range(int(height/8)):
+        for x_s in range(char_width):
+            dot_byte = 0
+            for k in range(8):
+                bmf_s = image.getpixel(((x_s + x_offset), (y_s * 8 + k)))
+                if(bmf_s < dot_threshold):
+                    dot_byte = dot_byte + 2**k
+            dot_array.append(dot_byte)
+    return bytes(dot_array)
+
+
+def reference_char_image(PILfont, char, width, height, yoffset):
+    image = Image.new('1', (width, height), color=255)
+    draw = ImageDraw.Draw(image)
+    draw.text((0, -yoffset), char, font=PILfont)
+    return image
+
+
+@pytest.mark.parametrize('height', ttf2bmh.FONT_HEIGHTS)
+def test_rendered_glyphs_match_reference(height):
+    font = ttf2bmh.render_font(FONT_FILE, height, ASCII_LINE)
+    [width, yoffset, font_height] = ttf2bmh.get_size_parameters(height)
+    PILfont = ImageFont.truetype(FONT_FILE, font_height)
+    for glyph in font['glyphs']:
+        image = reference_char_image(PILfont, glyph['char'], width, height, yoffset)
+        assert glyph['bitmap'] == reference_pixel_byte(image, height, width, 0), glyph['char']
+
+
+@pytest.mark.parametrize('height,width,char_width,x_offset', [(8, 6, 6, 0), (16, 12, 7, 3), (24, 18, 1, 17), (64, 48, 40, 5)])
+def test_random_images_match_reference(height, width, char_width, x_offset):
+    rng = np.random.default_rng(height)
+    image = Image.fromarray(np.where(rng.random((height, width)) < 0.4, 0, 255).astype(np.uint8)).convert('1')
+    assert ttf2bmh.get_pixel_byte(image, height, char_width, x_offset) == reference_pixel_byte(image, height, char_width, x_offset)
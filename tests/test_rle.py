@@ -0,0 +1,73 @@
+# RLE headers decode to the same page bytes as the uncompressed glyphs
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+import ttf2bmh
+
+BASE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT_FOLDER = os.path.join(BASE_FOLDER, 'fonts')
+FONT_FILE = os.path.join(FONT_FOLDER, '8x8.ttf')
+SCRIPT = os.path.join(BASE_FOLDER, 'src', 'ttf2bmh.py')
+# Unsorted, with two characters the font has no glyph for, so they share one bitmap
+CHARACTERS = 'zaA 0b:\U0001F600\U0001F642~'
+
+
+def parse_header_arrays(header_text):
+    arrays = {}
+    for name, values in re.findall(r'const \w+\*? (\w+)\[\](?: PROGMEM)? = \{([^}]*)\};', header_text):
+        arrays[name] = [int(value) for value in values.split(',') if value]
+    return arrays
+
+
+# Index into char_offset[]/char_width[], like char_lookup() of the header
+def lookup_index(arrays, lookup, char):
+    codepoint = ord(char)
+    if lookup == 'none':
+        return CHARACTERS.index(char)
+    if lookup == 'sorted':
+        position = arrays['char_codepoint'].index(codepoint)
+    else:
+        segments = zip(arrays['char_segment_start'], arrays['char_segment_end'], arrays['char_segment_first'])
+        position = [first + codepoint - start for start, end, first in segments if start <= codepoint <= end][0]
+    return arrays['char_index'][position] if 'char_index' in arrays else position
+
+
+@pytest.mark.parametrize('height', [8, 24])
+@pytest.mark.parametrize('variable_width', [False, True])
+def test_rle_round_trip(height, variable_width):
+    font = ttf2bmh.render_font(FONT_FILE, height, CHARACTERS, variable_width=variable_width)
+    for glyph in font['glyphs']:
+        assert ttf2bmh.rle_decode(ttf2bmh.rle_encode(glyph['bitmap']), len(glyph['bitmap'])) == glyph['bitmap']
+
+
+@pytest.mark.parametrize('data', [b'', b'\x00', b'\x01\x02', b'\x05' * 3, b'\x07' * 129, b'\x07' * 130,
+                                  bytes(range(200)), b'\x01\x02' + b'\x00' * 300 + bytes(range(130))])
+def test_rle_round_trip_edge_cases(data):
+    assert ttf2bmh.rle_decode(ttf2bmh.rle_encode(data)) == data
+
+
+@pytest.mark.parametrize('lookup', ['none', 'sorted', 'segments'])
+@pytest.mark.parametrize('dedup', [False, True])
+def test_rle_header_matches_uncompressed(tmp_path, lookup, dedup):
+    height = 24
+    options = ['-s', str(height), '-C', CHARACTERS, '--variable_width', '--compress', 'rle', '--lookup', lookup,
+               '--no_preview', '-f', FONT_FOLDER, '-o', str(tmp_path)]
+    if dedup:
+        options.append('--dedup')
+    subprocess.run([sys.executable, SCRIPT] + options, check=True, capture_output=True)
+    [header_filename] = [os.path.join(root, name) for root, _, names in os.walk(tmp_path) for name in names if name.endswith('.h')]
+    with open(header_filename, 'r') as header_file:
+        arrays = parse_header_arrays(header_file.read())
+
+    font = ttf2bmh.render_font(FONT_FILE, height, CHARACTERS, variable_width=True)
+    for glyph in font['glyphs']:
+        idx = lookup_index(arrays, lookup, glyph['char'])
+        assert arrays['char_width'][idx] == glyph['width']
+        encoded = bytes(arrays['bitmap_rle'][arrays['char_offset'][idx]:])
+        assert ttf2bmh.rle_decode(encoded, len(glyph['bitmap'])) == glyph['bitmap'], glyph['char']
+    if dedup:
+        assert len(set(arrays['char_offset'])) < len(CHARACTERS)
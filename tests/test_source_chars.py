@@ -0,0 +1,97 @@
+# Character set from the string literals of a source tree with C, JSON and PO files
+import pytest
+
+import ttf2bmh
+
+C_SOURCE = r'''#include "ÜberHeader.h"
+#include <wchar.h>
+// Kommentar mit Ö
+/* Block mit ß
+   über zwei Zeilen */
+long big = 1'000'000;
+int small = 10'000; const char *after_separator = "Ä";
+const char *quoted = "say \"ä\" \\ done";
+const char *raw = R"x(raw "é" \n)x";
+const wchar_t *wide = L"Ω";
+char c = 'q';
+char quote = '"';
+const char *hex = "\xB0";
+'''
+
+JSON_SOURCE = '''{"title": "Grad \\u00b0", "items": ["Ü", {"nested": "ç"}], "keyé": 1}'''
+
+PO_SOURCE = r'''# Kommentar ¿
+msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\n"
+
+msgid "Start"
+msgstr "Anfang ñ"
+
+msgid "Stop"
+msgstr ""
+
+#: main.c:12
+msgid "Wert"
+msgstr ""
+"Zeile \"€\" "
+"zwei"
+'''
+
+
+@pytest.fixture
+def source_tree(tmp_path):
+    (tmp_path / 'main.c').write_text(C_SOURCE, encoding='utf-8')
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'strings.json').write_text(JSON_SOURCE, encoding='utf-8')
+    (tmp_path / 'sub' / 'de.po').write_text(PO_SOURCE, encoding='utf-8')
+    (tmp_path / 'sub' / 'notes.txt').write_text('"Ÿ"', encoding='utf-8')
+    return tmp_path
+
+
+def test_c_strings():
+    assert list(ttf2bmh.get_c_strings(C_SOURCE)) == ['Ä', 'say "ä" \\ done', 'raw "é" \\n', 'Ω', '\xb0']
+
+
+@pytest.mark.parametrize('text,strings', [
+    ('#include "a.h"\n"b"', ['b']),
+    ('  #  include "a.h"\n', []),
+    ('x = "a" // "b"\n"c"', ['a', 'c']),
+    ('/* "a" */ "b"', ['b']),
+    ('"a\\"b"', ['a"b']),
+    ('u8R"(a"b)"', ['a"b']),
+    ('R"--(a)"b)--"', ['a)"b']),
+    ("1'000'000, \"a\", 'b'", ['a']),
+    ("0xFF'FF; \"a\"; c = '\\''; \"b\"", ['a', 'b']),
+    ("u'x' L\"y\"", ['y']),
+])
+def test_c_token_re(text, strings):
+    assert list(ttf2bmh.get_c_strings(text)) == strings
+
+
+def test_po_strings():
+    assert list(ttf2bmh.get_po_strings(PO_SOURCE.splitlines())) == ['Anfang ñ', 'Stop', '', 'Zeile "€" ', 'zwei']
+
+
+def test_scan_source_file(source_tree):
+    counts = ttf2bmh.scan_source_file(str(source_tree / 'main.c'))
+    assert set(counts) == set('Äsay "ä"\\doneraw"é"Ω\xb0n')
+    assert counts['"'] == 4
+    for char in 'ÜÖß':
+        assert char not in counts
+
+    counts = ttf2bmh.scan_source_file(str(source_tree / 'sub' / 'strings.json'))
+    assert set(counts) == set('Grad \xb0Üç')
+
+    counts = ttf2bmh.scan_source_file(str(source_tree / 'sub' / 'de.po'))
+    assert set(counts) == set('Anfang ñStopZeile "€" zwei')
+    for char in '¿\n':
+        assert char not in counts
+
+
+def test_source_tree(source_tree):
+    counts, file_count = ttf2bmh.count_source_characters(str(source_tree))
+    assert file_count == 3
+    assert 'Ÿ' not in counts
+    for char in 'ÄäéΩ\xb0Üçñ€':
+        assert char in counts